@@ -209,6 +209,7 @@ def run_migrations(engine: Engine) -> None:
             ('shared_parent_id', 'TEXT REFERENCES workspaces(id) ON DELETE SET NULL'),
             ('shared_at', 'DATETIME'),
             ('shared_by_user_id', 'TEXT REFERENCES users(id) ON DELETE SET NULL'),
+            ('row_version', 'INTEGER NOT NULL DEFAULT 1'),
         ],
     )
 
@@ -266,5 +267,6 @@ def run_migrations(engine: Engine) -> None:
             # мы уже создаём таблицу через SQLAlchemy, но у ранних БД могли отсутствовать эти поля
             ('period_start', 'DATE'),
             ('period_end', 'DATE'),
+            ('row_version', 'INTEGER NOT NULL DEFAULT 1'),
         ],
     )
@@ -495,6 +495,10 @@ class DocumentRecordORM(Base):
     shared_parent_id = Column(String, ForeignKey("workspaces.id", ondelete="SET NULL"), nullable=True, index=True)
     shared_at = Column(DateTime, nullable=True)
     shared_by_user_id = Column(String, ForeignKey("users.id", ondelete="SET NULL"), nullable=True)
+    # Optimistic lock: every ORM UPDATE checks and bumps it, so concurrent approvals conflict.
+    row_version = Column(Integer, nullable=False, default=1)
+
+    __mapper_args__ = {"version_id_col": row_version}
 
     workspace = relationship("WorkspaceORM", foreign_keys=[workspace_id])
     work_package = relationship("WorkPackageORM", back_populates="documents")
@@ -676,6 +680,10 @@ class DocumentV2ORM(Base):
     meta = Column(JSON, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+    # ``version`` numbers rendered revisions; ``row_version`` is the optimistic lock.
+    row_version = Column(Integer, nullable=False, default=1)
+
+    __mapper_args__ = {"version_id_col": row_version}
 
     package = relationship("ClosingPackageORM", back_populates="documents")
     contract = relationship("ContractV2ORM")
@@ -1,12 +1,18 @@
 from __future__ import annotations
 
+import hashlib
 import json
 import logging
 import os
 import re
-from typing import Iterable, Optional, Tuple, List, Any, Collection
-from collections import defaultdict
-from uuid import uuid4
+import threading
+from copy import deepcopy
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Iterable, Optional, Tuple, List, Any, Collection, Mapping
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 
 # env: подхватываем и backend/.env, и корневой .env.local
 try:
@@ -37,7 +43,7 @@ _openai_client: Optional["OpenAI"] = None
 if OPENAI_API_KEY and OpenAI is not None:
     _openai_client = OpenAI(api_key=OPENAI_API_KEY)
 
-from datetime import datetime, date
+from datetime import datetime, date, timezone
 from calendar import monthrange
 from .contracts import ServiceError
 
@@ -52,6 +58,10 @@ def _normalize_role_value(value: Any) -> str | None:
     return normalized
 
 
+_ADMIN_ROLES = frozenset({"admin", "accountant"})
+_SUBMITTER_ROLES = frozenset({"admin", "accountant", "manager"})
+
+
 def _collect_user_roles(primary: Any, extra: Iterable[Any] | None) -> set[str]:
     roles: set[str] = set()
     primary_value = _normalize_role_value(primary)
@@ -94,9 +104,12 @@ from docx.oxml import OxmlElement
 from docx.oxml.ns import qn
 from docx.shared import Pt, RGBColor
 from docx.table import _Cell
-from sqlalchemy import select
-from sqlalchemy.orm import Session, selectinload, object_session
-from sqlalchemy.orm.attributes import flag_modified
+from lxml import etree
+from lxml import html as lxml_html
+from sqlalchemy import and_, delete, func, inspect, or_, select, update
+from sqlalchemy.orm import Session, joinedload, selectinload, object_session
+from sqlalchemy.orm.attributes import flag_modified, set_committed_value
+from sqlalchemy.orm.exc import StaleDataError
 
 from .. import orm_models
 from .directory import ensure_individual_account
@@ -127,6 +140,9 @@ DOCUMENT_TYPE_MAP = {
     "Приказ": "order",
 }
 
+# Document type labels containing any of these are service assignments.
+_SERVICE_ASSIGNMENT_KEYWORDS = ("служеб", "задани")
+
 DOC_V2_TYPE_LABELS = {
     "AVR": "Акт",
     "APP": "Акт",
@@ -154,6 +170,16 @@ DOC_V2_PRIORITY = {
     "ORDER": 5,
 }
 
+_STATUS_PRIORITY: Mapping[str, int] = MappingProxyType({
+    "rejected_performer": 0,
+    "rejected_manager": 0,
+    "draft": 10,
+    "pending_performer": 20,
+    "pending_manager": 30,
+    "manager_approved": 40,
+    "final": 50,
+})
+
 DOC_V2_AUDIENCE = {
     "AVR": ["act"],
     "APP": ["act"],
@@ -167,7 +193,7 @@ DOC_V2_AUDIENCE = {
 PLACEHOLDER_PATTERN = re.compile(r"\$\{([^}]+)\}")
 
 
-TEMPLATE_VARIABLE_EXPORT_KEYS: set[str] = {
+TEMPLATE_VARIABLE_EXPORT_KEYS: tuple[str, ...] = (
     "companyName",
     "companyInn",
     "companyKpp",
@@ -213,7 +239,7 @@ TEMPLATE_VARIABLE_EXPORT_KEYS: set[str] = {
     "totalAmountWords",
     "vatAmountNumeric",
     "vatAmountWords",
-}
+)
 
 
 CONTRACT_EXTRA_MAPPING: dict[str, str] = {
@@ -248,39 +274,45 @@ CONTRACT_EXTRA_MAPPING: dict[str, str] = {
 logger = logging.getLogger(__name__)
 
 
+_V2_STATUS_ALIASES: Mapping[str, str] = MappingProxyType({
+    'draft': 'draft',
+    'pending_performer': 'pending_performer',
+    'pendingperformer': 'pending_performer',
+    'pending_performer_approval': 'pending_performer',
+    'pending_manager': 'pending_manager',
+    'pendingmanager': 'pending_manager',
+    'pending_manager_approval': 'pending_manager',
+    'manager_approved': 'manager_approved',
+    'managerapproved': 'manager_approved',
+    'manager-approved': 'manager_approved',
+    'managerapprovedpending': 'manager_approved',
+    'performer_approved': 'pending_manager',
+    'performerapproved': 'pending_manager',
+    'performer-approved': 'pending_manager',
+    'rejected_performer': 'rejected_performer',
+    'performer_rejected': 'rejected_performer',
+    'performer-rejected': 'rejected_performer',
+    'rejected_manager': 'rejected_manager',
+    'manager_rejected': 'rejected_manager',
+    'manager-rejected': 'rejected_manager',
+    'final': 'final',
+    'finalized': 'final',
+    'completed': 'final',
+})
+
+
 def _normalize_v2_status(value: object) -> str:
     if value is None:
         return "draft"
+    # Stored statuses are almost always already canonical; skip the text clean-up for them.
+    direct = _V2_STATUS_ALIASES.get(value) if isinstance(value, str) else None
+    if direct is not None:
+        return direct
     text = str(value).strip().lower()
     if not text:
         return "draft"
     text = text.replace('-', '_').replace(' ', '_')
-    mapping = {
-        'draft': 'draft',
-        'pending_performer': 'pending_performer',
-        'pendingperformer': 'pending_performer',
-        'pending_performer_approval': 'pending_performer',
-        'pending_manager': 'pending_manager',
-        'pendingmanager': 'pending_manager',
-        'pending_manager_approval': 'pending_manager',
-        'manager_approved': 'manager_approved',
-        'managerapproved': 'manager_approved',
-        'manager-approved': 'manager_approved',
-        'managerapprovedpending': 'manager_approved',
-        'performer_approved': 'pending_manager',
-        'performerapproved': 'pending_manager',
-        'performer-approved': 'pending_manager',
-        'rejected_performer': 'rejected_performer',
-        'performer_rejected': 'rejected_performer',
-        'performer-rejected': 'rejected_performer',
-        'rejected_manager': 'rejected_manager',
-        'manager_rejected': 'rejected_manager',
-        'manager-rejected': 'rejected_manager',
-        'final': 'final',
-        'finalized': 'final',
-        'completed': 'final',
-    }
-    return mapping.get(text, 'draft')
+    return _V2_STATUS_ALIASES.get(text, 'draft')
 
 
 def _format_currency(value: float, currency: str = "RUB") -> str:
@@ -332,8 +364,7 @@ def _stringify_value(value: object) -> str:
 def _short_name(full_name: str | None) -> str:
     if not full_name:
         return ""
-    parts = re.split(r"[\s,]+", full_name.strip())
-    parts = [part for part in parts if part]
+    parts = full_name.replace(",", " ").split()
     if not parts:
         return ""
     if len(parts) == 1:
@@ -604,6 +635,13 @@ def _strip_meta_lines(value: str) -> str:
     return text.strip()
 
 
+@lru_cache(maxsize=512)
+def _clean_task_description(value: str) -> str:
+    # The act prompt, the assignment prompt and its fallback all clean the
+    # same descriptions; keep the result so each one is processed only once.
+    return _strip_meta_lines(_strip_html_markup(value))
+
+
 def _shorten(value: str, limit: int = 1500) -> str:
     value = (value or "").strip()
     return (value[:limit] + "…") if len(value) > limit else value
@@ -612,7 +650,7 @@ def _shorten(value: str, limit: int = 1500) -> str:
 def _normalize_bullet_sentence(value: str) -> str:
     if not value:
         return ""
-    text = _strip_meta_lines(_strip_html_markup(value))
+    text = _clean_task_description(value)
     text = re.sub(r"\[[^\]]*\]\s*", "", text)
     text = re.sub(r"ACS-\d+\s*[—\-:]\s*", "", text, flags=re.I)
     text = re.sub(r"^[\s\d\.\)\-–—•*]+", "", text)
@@ -795,13 +833,40 @@ def _initialize_document_defaults(document: Document) -> None:
         pass
 
 
+_PARAGRAPH_ALIGNMENTS = {
+    'center': WD_ALIGN_PARAGRAPH.CENTER,
+    'right': WD_ALIGN_PARAGRAPH.RIGHT,
+    'justify': WD_ALIGN_PARAGRAPH.JUSTIFY,
+}
+
+# CSS property -> (run attribute, predicate); without a predicate the raw value is kept.
+_RUN_STYLE_PROPERTIES = {
+    'font-weight': ('bold', lambda value: value in ('bold', '700')),
+    'font-style': ('italic', lambda value: value == 'italic'),
+    'text-decoration': ('underline', lambda value: 'underline' in value),
+    'color': ('color', None),
+    'font-size': ('size', None),
+    'font-family': ('font', None),
+}
+
+
+_RUN_ATTR_KEYS = ('bold', 'italic', 'underline', 'color', 'size', 'font')
+
+
+def _run_attrs_key(attrs: dict[str, object]) -> tuple:
+    # Read in a fixed key order: a bold-only and an italic-only frame must not
+    # collapse to the same key just because their dicts were built differently.
+    return tuple(attrs.get(key) for key in _RUN_ATTR_KEYS)
+
+
 class DocxHtmlRenderer(HTMLParser):
     def __init__(self, document: Document, container: _Cell | None = None) -> None:
         super().__init__(convert_charrefs=True)
         self.document = document
         self.container = container
+        self._container_is_cell = isinstance(container, _Cell)
         self.current_paragraph = None
-        self.run_attrs_stack: list[dict[str, bool]] = [{
+        self.run_attrs_stack: list[dict[str, object]] = [{
             'bold': False,
             'italic': False,
             'underline': False,
@@ -816,10 +881,14 @@ class DocxHtmlRenderer(HTMLParser):
         self.initial_paragraph = None
         self.initial_paragraph_used = False
         self._paragraph_style_depth = 0
-        self._current_paragraph_classes: set[str] = set()
+        self._current_paragraph_classes: frozenset[str] = frozenset()
         self.section_stack: list[dict[str, object]] = []
         self.list_item_stack: list[dict[str, object]] = []
         self._paragraph_reuse_stack: list[bool] = []
+        self._last_run = None
+        self._last_run_key: tuple | None = None
+        self._last_applied_key: tuple | None = None
+        self._last_applied_rpr = None
 
         if container is None:
             if document.paragraphs:
@@ -838,6 +907,18 @@ class DocxHtmlRenderer(HTMLParser):
         self.close()
         self.finalize()
 
+    def replay(self, events: Iterable[tuple]) -> None:
+        """Render parser events captured by another renderer without re-tokenizing."""
+        for event in events:
+            kind = event[0]
+            if kind == 'start':
+                self.handle_starttag(event[1], event[2])
+            elif kind == 'end':
+                self.handle_endtag(event[1])
+            else:
+                self.handle_data(event[1])
+        self.finalize()
+
     def finalize(self) -> None:
         self.current_paragraph = None
 
@@ -847,73 +928,36 @@ class DocxHtmlRenderer(HTMLParser):
         tag_lower = tag.lower()
 
         if self.capture_stack:
-            self.capture_stack[-1]['buffer'].append(_format_start_tag(tag, attrs))
-            self.capture_stack[-1]['depth'] += 1
+            capture = self.capture_stack[-1]
+            capture['events'].append(('start', tag, attrs))
+            capture['depth'] += 1
+            if tag_lower == 'tr':
+                capture['cell']['has_rows'] = True
             return
 
         if self._capture_start(tag_lower, attrs):
             return
 
-        attr_map = _attrs_to_dict(attrs)
+        handler = self._START_HANDLERS.get(tag_lower)
+        if handler is None:
+            return
+
+        attr_map = dict(attrs)
         style_map = _extract_style(attrs)
         element_classes = _extract_classes(attr_map)
         if tag_lower == 'div':
-            self.section_stack.append({'classes': element_classes.copy(), 'paragraph_count': 0, 'table_count': 0})
+            self.section_stack.append({'classes': element_classes, 'paragraph_count': 0, 'table_count': 0})
 
-        inherited_classes: set[str] = set()
+        # Class sets are frozen, so the element's own set is shared when nothing is inherited.
+        classes = element_classes
         for context in self.section_stack:
-            inherited_classes.update(context.get('classes', set()))
-        classes = element_classes | inherited_classes
+            section_classes = context.get('classes')
+            if section_classes and not section_classes <= classes:
+                classes = classes | section_classes
 
         _apply_class_to_style(style_map, classes)
 
-        if tag_lower == 'div' and element_classes.intersection({'doc-template', 'doc-template-preview'}):
-            return
-
-        if tag_lower in {'p', 'div'}:
-            reuse = False
-            if tag_lower == 'p' and self.list_item_stack:
-                li_ctx = self.list_item_stack[-1]
-                paragraph = li_ctx.get('paragraph')
-                if paragraph is not None:
-                    if self.current_paragraph is None:
-                        self.current_paragraph = paragraph  # reuse list item paragraph
-                    reuse = True
-            self._start_paragraph(attr_map, style_map, classes, reuse_current=reuse)
-        elif tag_lower in {'h1', 'h2', 'h3', 'h4', 'h5', 'h6'}:
-            para = self._start_paragraph(attr_map, style_map, classes)
-            try:
-                para.style = f"Heading {int(tag_lower[1])}"
-            except (ValueError, KeyError):
-                pass
-        elif tag_lower in {'strong', 'b'}:
-            self._push_run_attrs(bold=True)
-        elif tag_lower in {'em', 'i'}:
-            self._push_run_attrs(italic=True)
-        elif tag_lower in {'u', 'ins'}:
-            self._push_run_attrs(underline=True)
-        elif tag_lower == 'span':
-            if 'doc-flexline__tab' in element_classes:
-                paragraph = self._ensure_paragraph()
-                paragraph.add_run().add_tab()
-            self._push_run_attrs(style_map=style_map)
-        elif tag_lower == 'br':
-            paragraph = self._ensure_paragraph()
-            paragraph.add_run().add_break()
-        elif tag_lower == 'ul':
-            self.list_stack.append('bullet')
-        elif tag_lower == 'ol':
-            self.list_stack.append('number')
-        elif tag_lower == 'li':
-            list_type = self.list_stack[-1] if self.list_stack else 'bullet'
-            paragraph = self._start_paragraph(attr_map, style_map, classes, list_type=list_type)
-            self.list_item_stack.append({'paragraph': paragraph})
-        elif tag_lower == 'table':
-            self._break_paragraph()
-            self.table_stack.append({'rows': [], 'current_row': None, 'attrs': attr_map, 'style': style_map, 'classes': classes})
-        elif tag_lower == 'tr':
-            if self.table_stack:
-                self.table_stack[-1]['current_row'] = []
+        handler(self, tag_lower, attr_map, style_map, classes, element_classes)
 
     def handle_endtag(self, tag: str) -> None:  # type: ignore[override]
         tag_lower = tag.lower()
@@ -921,34 +965,126 @@ class DocxHtmlRenderer(HTMLParser):
         if self._capture_end(tag_lower):
             return
 
-        if tag_lower in {'strong', 'b', 'em', 'i', 'u', 'ins', 'span'}:
-            if len(self.run_attrs_stack) > 1:
-                self.run_attrs_stack.pop()
-        elif tag_lower in {'p', 'div', 'li', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6'}:
-            self._break_paragraph()
-            if tag_lower == 'li' and self.list_item_stack:
-                self.list_item_stack.pop()
-        elif tag_lower in {'ul', 'ol'}:
-            if self.list_stack:
-                self.list_stack.pop()
-        elif tag_lower == 'tr':
-            if self.table_stack:
-                ctx = self.table_stack[-1]
-                row = ctx.get('current_row')
-                if row is not None:
-                    ctx['rows'].append(row)
-                    ctx['current_row'] = None
-        elif tag_lower == 'table':
-            if self.table_stack:
-                ctx = self.table_stack.pop()
-                self._flush_table(ctx)
-        elif tag_lower == 'div':
-            if self.section_stack:
-                self.section_stack.pop()
+        handler = self._END_HANDLERS.get(tag_lower)
+        if handler is not None:
+            handler(self, tag_lower)
+
+    # Start tag handlers ------------------------------------------------
+
+    def _start_block(self, tag, attr_map, style_map, classes, element_classes) -> None:
+        if tag == 'div' and element_classes & _TEMPLATE_ROOT_CLASSES:
+            return
+        reuse = False
+        if tag == 'p' and self.list_item_stack:
+            li_ctx = self.list_item_stack[-1]
+            paragraph = li_ctx.get('paragraph')
+            if paragraph is not None:
+                if self.current_paragraph is None:
+                    self.current_paragraph = paragraph  # reuse list item paragraph
+                reuse = True
+        self._start_paragraph(attr_map, style_map, classes, reuse_current=reuse)
+
+    def _start_heading(self, tag, attr_map, style_map, classes, element_classes) -> None:
+        para = self._start_paragraph(attr_map, style_map, classes)
+        try:
+            para.style = f"Heading {int(tag[1])}"
+        except (ValueError, KeyError):
+            pass
+
+    def _start_bold(self, tag, attr_map, style_map, classes, element_classes) -> None:
+        self._push_run_attrs(bold=True)
+
+    def _start_italic(self, tag, attr_map, style_map, classes, element_classes) -> None:
+        self._push_run_attrs(italic=True)
+
+    def _start_underline(self, tag, attr_map, style_map, classes, element_classes) -> None:
+        self._push_run_attrs(underline=True)
+
+    def _start_span(self, tag, attr_map, style_map, classes, element_classes) -> None:
+        if 'doc-flexline__tab' in element_classes:
+            paragraph = self._ensure_paragraph()
+            paragraph.add_run().add_tab()
+        self._push_run_attrs(style_map=style_map)
+
+    def _start_break(self, tag, attr_map, style_map, classes, element_classes) -> None:
+        paragraph = self._ensure_paragraph()
+        paragraph.add_run().add_break()
+
+    def _start_list(self, tag, attr_map, style_map, classes, element_classes) -> None:
+        self.list_stack.append('bullet' if tag == 'ul' else 'number')
+
+    def _start_list_item(self, tag, attr_map, style_map, classes, element_classes) -> None:
+        list_type = self.list_stack[-1] if self.list_stack else 'bullet'
+        paragraph = self._start_paragraph(attr_map, style_map, classes, list_type=list_type)
+        self.list_item_stack.append({'paragraph': paragraph})
+
+    def _start_table(self, tag, attr_map, style_map, classes, element_classes) -> None:
+        self._break_paragraph()
+        self.table_stack.append({'rows': [], 'current_row': None, 'attrs': attr_map, 'style': style_map, 'classes': classes})
+
+    def _start_row(self, tag, attr_map, style_map, classes, element_classes) -> None:
+        if self.table_stack:
+            self.table_stack[-1]['current_row'] = []
+
+    _START_HANDLERS = {
+        'p': _start_block,
+        'div': _start_block,
+        **dict.fromkeys(('h1', 'h2', 'h3', 'h4', 'h5', 'h6'), _start_heading),
+        'strong': _start_bold,
+        'b': _start_bold,
+        'em': _start_italic,
+        'i': _start_italic,
+        'u': _start_underline,
+        'ins': _start_underline,
+        'span': _start_span,
+        'br': _start_break,
+        'ul': _start_list,
+        'ol': _start_list,
+        'li': _start_list_item,
+        'table': _start_table,
+        'tr': _start_row,
+    }
+
+    # End tag handlers --------------------------------------------------
+
+    def _end_inline(self, tag) -> None:
+        if len(self.run_attrs_stack) > 1:
+            self.run_attrs_stack.pop()
+
+    def _end_block(self, tag) -> None:
+        self._break_paragraph()
+        if tag == 'li' and self.list_item_stack:
+            self.list_item_stack.pop()
+
+    def _end_list(self, tag) -> None:
+        if self.list_stack:
+            self.list_stack.pop()
+
+    def _end_row(self, tag) -> None:
+        if self.table_stack:
+            ctx = self.table_stack[-1]
+            row = ctx.get('current_row')
+            if row is not None:
+                ctx['rows'].append(row)
+                ctx['current_row'] = None
+
+    def _end_table(self, tag) -> None:
+        if self.table_stack:
+            ctx = self.table_stack.pop()
+            self._flush_table(ctx)
+
+    _END_HANDLERS = {
+        **dict.fromkeys(('strong', 'b', 'em', 'i', 'u', 'ins', 'span'), _end_inline),
+        **dict.fromkeys(('p', 'div', 'li', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6'), _end_block),
+        'ul': _end_list,
+        'ol': _end_list,
+        'tr': _end_row,
+        'table': _end_table,
+    }
 
     def handle_data(self, data: str) -> None:  # type: ignore[override]
         if self.capture_stack:
-            self.capture_stack[-1]['buffer'].append(data)
+            self.capture_stack[-1]['events'].append(('data', data))
             return
         self._append_text(data)
 
@@ -960,13 +1096,14 @@ class DocxHtmlRenderer(HTMLParser):
         ctx = self.table_stack[-1]
         if ctx.get('current_row') is None:
             ctx['current_row'] = []
-        attr_map = _attrs_to_dict(attrs)
+        attr_map = dict(attrs)
         class_set = _extract_classes(attr_map)
-        cell_ref = {'tag': tag, 'html': '', 'attrs': attr_map, 'classes': class_set}
+        events: list[tuple] = [('start', tag, attrs)]
+        cell_ref = {'tag': tag, 'events': events, 'attrs': attr_map, 'classes': class_set}
         ctx['current_row'].append(cell_ref)
         self.capture_stack.append({
             'tag': tag,
-            'buffer': [_format_start_tag(tag, attrs)],
+            'events': events,
             'depth': 1,
             'context': ctx,
             'cell': cell_ref,
@@ -977,11 +1114,9 @@ class DocxHtmlRenderer(HTMLParser):
         if not self.capture_stack:
             return False
         capture = self.capture_stack[-1]
-        capture['buffer'].append(f"</{tag}>")
+        capture['events'].append(('end', tag))
         capture['depth'] -= 1
         if capture['depth'] <= 0:
-            cell_ref = capture['cell']
-            cell_ref['html'] = ''.join(capture['buffer'])
             self.capture_stack.pop()
         return True
 
@@ -991,7 +1126,7 @@ class DocxHtmlRenderer(HTMLParser):
         self,
         attr_map: dict[str, str | None] | None,
         style_map: dict[str, str],
-        classes: set[str],
+        classes: frozenset[str],
         *,
         list_type: str | None = None,
         reuse_current: bool = False,
@@ -999,7 +1134,7 @@ class DocxHtmlRenderer(HTMLParser):
         style_map = dict(style_map)
         for context in reversed(self.section_stack):
             context['paragraph_count'] = context.get('paragraph_count', 0) + 1
-            _apply_section_paragraph_rules(style_map, context.get('classes', set()), context['paragraph_count'])
+            _apply_section_paragraph_rules(style_map, context.get('classes', _NO_CLASSES), context['paragraph_count'])
 
         paragraph = None
         if reuse_current and self.current_paragraph is not None:
@@ -1007,21 +1142,18 @@ class DocxHtmlRenderer(HTMLParser):
         else:
             paragraph = self._new_paragraph(list_type)
         if reuse_current:
-            self._current_paragraph_classes.update(classes)
+            self._current_paragraph_classes = self._current_paragraph_classes | classes
         else:
-            self._current_paragraph_classes = set(classes)
-        alignment = None
-        if attr_map and attr_map.get('align'):
-            alignment = (attr_map.get('align') or '').lower()
-        if style_map.get('text-align'):
-            alignment = style_map['text-align']
+            self._current_paragraph_classes = classes
+        alignment = style_map.get('text-align')
+        if not alignment and attr_map:
+            align_attr = attr_map.get('align')
+            if align_attr:
+                alignment = align_attr.lower()
         if alignment:
-            if alignment == 'center':
-                paragraph.alignment = WD_ALIGN_PARAGRAPH.CENTER
-            elif alignment == 'right':
-                paragraph.alignment = WD_ALIGN_PARAGRAPH.RIGHT
-            elif alignment == 'justify':
-                paragraph.alignment = WD_ALIGN_PARAGRAPH.JUSTIFY
+            wd_alignment = _PARAGRAPH_ALIGNMENTS.get(alignment)
+            if wd_alignment is not None:
+                paragraph.alignment = wd_alignment
         _apply_paragraph_styling(paragraph, style_map, classes)
         self.current_paragraph = paragraph
         self._paragraph_style_depth += 1
@@ -1036,7 +1168,7 @@ class DocxHtmlRenderer(HTMLParser):
         elif list_type == 'number':
             style_name = 'List Number'
 
-        if isinstance(self.container, _Cell):
+        if self._container_is_cell:
             if not self.cell_initialized:
                 paragraph = self.container.paragraphs[0]
                 _clear_paragraph(paragraph)
@@ -1071,7 +1203,7 @@ class DocxHtmlRenderer(HTMLParser):
         if reuse:
             return
         self.current_paragraph = None
-        self._current_paragraph_classes = set()
+        self._current_paragraph_classes = frozenset()
 
     # Formatting helpers ------------------------------------------------
 
@@ -1083,7 +1215,8 @@ class DocxHtmlRenderer(HTMLParser):
         underline: bool | None = None,
         style_map: dict[str, str] | None = None,
     ) -> None:
-        attrs = self.run_attrs_stack[-1].copy()
+        # Frames only hold the keys they override; the base frame holds them all.
+        attrs: dict[str, object] = {}
         if bold is not None:
             attrs['bold'] = bold
         if italic is not None:
@@ -1091,24 +1224,15 @@ class DocxHtmlRenderer(HTMLParser):
         if underline is not None:
             attrs['underline'] = underline
         if style_map:
-            font_weight = style_map.get('font-weight')
-            if font_weight in {'bold', '700'}:
-                attrs['bold'] = True
-            font_style = style_map.get('font-style')
-            if font_style == 'italic':
-                attrs['italic'] = True
-            text_decoration = style_map.get('text-decoration')
-            if text_decoration and 'underline' in text_decoration:
-                attrs['underline'] = True
-            color_value = style_map.get('color')
-            if color_value:
-                attrs['color'] = color_value
-            font_size = style_map.get('font-size')
-            if font_size:
-                attrs['size'] = font_size
-            font_family = style_map.get('font-family')
-            if font_family:
-                attrs['font'] = font_family
+            for key, value in style_map.items():
+                target = _RUN_STYLE_PROPERTIES.get(key)
+                if target is None or not value:
+                    continue
+                name, matches = target
+                if matches is None:
+                    attrs[name] = value
+                elif matches(value):
+                    attrs[name] = True
         self.run_attrs_stack.append(attrs)
 
     def _append_text(self, text: str) -> None:
@@ -1118,18 +1242,48 @@ class DocxHtmlRenderer(HTMLParser):
         text = text.replace('\r', '')
         parts = text.split('\n')
         emitted = bool(paragraph.text)
+        attrs = self._current_run_attrs()
+        attrs_key = _run_attrs_key(attrs)
+        # Keep writing into the previous run while it is still the paragraph's
+        # last one and carries the same formatting.
+        run = self._last_run
+        if run is None or self._last_run_key != attrs_key or not _is_trailing_run(paragraph, run):
+            run = None
         for index, part in enumerate(parts):
             if index > 0 and emitted:
-                paragraph.add_run().add_break()
+                if run is None:
+                    run = paragraph.add_run()
+                    self._apply_run_attrs(run, attrs)
+                run.add_break()
             elif index > 0 and not emitted and not part:
                 continue
             if part:
-                run = paragraph.add_run(_preserve_spaces(part))
-                self._apply_run_attrs(run)
+                if run is None:
+                    run = paragraph.add_run()
+                    self._apply_run_attrs(run, attrs)
+                run.add_text(_preserve_spaces(part))
                 emitted = True
-
-    def _apply_run_attrs(self, run) -> None:
-        attrs = self.run_attrs_stack[-1]
+        if run is not None:
+            self._last_run = run
+            self._last_run_key = attrs_key
+
+    def _current_run_attrs(self) -> dict[str, object]:
+        # Later frames override earlier ones; the base frame supplies defaults.
+        frames = iter(self.run_attrs_stack)
+        resolved = dict(next(frames))
+        for frame in frames:
+            resolved.update(frame)
+        return resolved
+
+    def _apply_run_attrs(self, run, attrs: dict[str, object] | None = None) -> None:
+        if attrs is None:
+            attrs = self._current_run_attrs()
+        if not any(attrs.values()):
+            return
+        attrs_key = _run_attrs_key(attrs)
+        if attrs_key == self._last_applied_key and self._last_applied_rpr is not None:
+            run._r.insert(0, deepcopy(self._last_applied_rpr))
+            return
         run.bold = True if attrs.get('bold') else None
         run.italic = True if attrs.get('italic') else None
         run.underline = True if attrs.get('underline') else None
@@ -1148,6 +1302,8 @@ class DocxHtmlRenderer(HTMLParser):
             family = _parse_font_family(font_value)
             if family:
                 run.font.name = family
+        self._last_applied_key = attrs_key
+        self._last_applied_rpr = run._r.rPr
 
     def _flush_table(self, ctx: dict[str, object]) -> None:
         rows = _normalize_rows(ctx.get('rows') or [])
@@ -1160,28 +1316,32 @@ class DocxHtmlRenderer(HTMLParser):
         if isinstance(attrs, dict):
             table_classes.update(_extract_classes(attrs))
         stack_classes = ctx.get('classes')
-        if isinstance(stack_classes, set):
+        if isinstance(stack_classes, (set, frozenset)):
             table_classes.update(stack_classes)
         for section in self.section_stack:
-            table_classes.update(section.get('classes', set()))
+            table_classes.update(section.get('classes', _NO_CLASSES))
         _apply_table_class_style(table, table_classes)
-        for row_idx, row in enumerate(rows):
-            for col_idx in range(max_cols):
-                cell = table.cell(row_idx, col_idx)
-                _clear_paragraph(cell.paragraphs[0])
-                if col_idx < len(row):
-                    cell_ref = row[col_idx]
-                    cell_html = cell_ref.get('html') if isinstance(cell_ref, dict) else ''
-                    renderer = DocxHtmlRenderer(self.document, container=cell)
-                    renderer.render(cell_html)
-                    if isinstance(cell_ref, dict) and cell_ref.get('tag') == 'th':
-                        for paragraph in cell.paragraphs:
-                            for run in paragraph.runs:
-                                run.bold = True
+        # Walk the freshly created w:tr/w:tc elements directly: table.cell()
+        # rebuilds the whole cell grid on every call.
+        for row, tr in zip(rows, table._tbl.tr_lst):
+            for cell_ref, tc in zip(row, tr.tc_lst):
+                if not isinstance(cell_ref, dict):
+                    continue
+                renderer = DocxHtmlRenderer(self.document, container=_Cell(tc, table))
+                events = cell_ref.get('events')
+                if events is not None:
+                    renderer.replay(events)
+                else:
+                    renderer.render(cell_ref.get('html') or '')
+                if cell_ref.get('tag') == 'th':
+                    _set_cell_runs_bold(tc)
         self._break_paragraph()
         for section in reversed(self.section_stack):
             section['table_count'] = section.get('table_count', 0) + 1
-            _apply_section_table_rules(table, section.get('classes', set()), section['table_count'])
+            _apply_section_table_rules(table, section.get('classes', _NO_CLASSES), section['table_count'])
+
+
+_STYLE_DECLARATION_PATTERN = re.compile(r'([^:;]+):([^;]*)')
 
 
 def _extract_style(attrs: list[tuple[str, str | None]]) -> dict[str, str]:
@@ -1190,32 +1350,48 @@ def _extract_style(attrs: list[tuple[str, str | None]]) -> dict[str, str]:
         if name == 'style' and value:
             style_text = value
             break
-    styles: dict[str, str] = {}
-    for chunk in style_text.split(';'):
-        if ':' in chunk:
-            key, val = chunk.split(':', 1)
-            styles[key.strip().lower()] = val.strip().lower()
-    return styles
+    if not style_text:
+        return {}
+    return {
+        key.strip(): val.strip()
+        for key, val in _STYLE_DECLARATION_PATTERN.findall(style_text.lower())
+    }
+
+
+def _set_cell_runs_bold(tc) -> None:
+    for p in tc.iterchildren(qn('w:p')):
+        for r in p.iterchildren(qn('w:r')):
+            r.get_or_add_rPr()._set_bool_val('b', True)
+
 
+_QN_PPR = qn('w:pPr')
 
-def _attrs_to_dict(attrs: list[tuple[str, str | None]]) -> dict[str, str | None]:
-    return {name: value for name, value in attrs}
+
+def _is_trailing_run(paragraph, run) -> bool:
+    element = run._r
+    return element.getparent() is paragraph._p and element.getnext() is None
 
 
 def _clear_paragraph(paragraph) -> None:
+    # Fresh paragraphs (new cells, new documents) hold at most their w:pPr.
+    if all(child.tag == _QN_PPR for child in paragraph._p):
+        return
     for run in paragraph.runs:
         run.text = ''
     paragraph.text = ''
 
 
 def _format_start_tag(tag: str, attrs: list[tuple[str, str | None]]) -> str:
+    if not attrs:
+        return f'<{tag}>'
     parts = [tag]
     for name, value in attrs:
         if value is None:
             continue
-        escaped = value.replace('"', '&quot;') if isinstance(value, str) else ''
-        parts.append(f'{name}="{escaped}"')
-    return '<' + ' '.join(parts) + '>'
+        if '"' in value:
+            value = value.replace('"', '&quot;')
+        parts.append(f'{name}="{value}"')
+    return f"<{' '.join(parts)}>"
 
 
 def _remove_paragraph(paragraph) -> None:
@@ -1225,24 +1401,35 @@ def _remove_paragraph(paragraph) -> None:
         parent.remove(element)
 
 
-def _extract_classes(attr_map: dict[str, str | None] | None) -> set[str]:
+def _extract_classes(attr_map: dict[str, str | None] | None) -> frozenset[str]:
     if not attr_map:
-        return set()
+        return _NO_CLASSES
     raw = attr_map.get('class')
     if not raw:
-        return set()
-    classes = {cls.strip() for cls in raw.replace('\t', ' ').split(' ') if cls.strip()}
-    return classes
+        return _NO_CLASSES
+    return frozenset(raw.split())
+
+
+_NO_CLASSES: frozenset[str] = frozenset()
+_TEMPLATE_ROOT_CLASSES = frozenset({'doc-template', 'doc-template-preview'})
+_CENTER_CLASSES = frozenset({'doc-center', 'text-center'})
+_RIGHT_CLASSES = frozenset({'doc-right', 'text-right'})
+_JUSTIFY_CLASSES = frozenset({'doc-justify', 'text-justify'})
+_NO_INDENT_CLASSES = frozenset({'doc-no-indent', 'no-indent'})
+_TRANSPARENT_TABLE_CLASSES = frozenset({'doc-table-transparent', 'doc-table-plain'})
+_BORDERED_TABLE_CLASSES = frozenset({'doc-table-bordered', 'doc-table-striped'})
 
 
-def _apply_class_to_style(style_map: dict[str, str], classes: set[str]) -> None:
-    if 'doc-center' in classes or 'text-center' in classes:
+def _apply_class_to_style(style_map: dict[str, str], classes: frozenset[str]) -> None:
+    if not classes:
+        return
+    if classes & _CENTER_CLASSES:
         style_map.setdefault('text-align', 'center')
-    if 'doc-right' in classes or 'text-right' in classes:
+    if classes & _RIGHT_CLASSES:
         style_map.setdefault('text-align', 'right')
-    if 'doc-justify' in classes or 'text-justify' in classes:
+    if classes & _JUSTIFY_CLASSES:
         style_map.setdefault('text-align', 'justify')
-    if 'doc-no-indent' in classes or 'no-indent' in classes:
+    if classes & _NO_INDENT_CLASSES:
         style_map.setdefault('text-indent', '0')
         style_map.setdefault('margin-left', '0')
     if 'doc-flexline' in classes:
@@ -1251,24 +1438,35 @@ def _apply_class_to_style(style_map: dict[str, str], classes: set[str]) -> None:
 
 
 def _apply_table_class_style(table, classes: set[str]) -> None:
-    if {'doc-table-transparent', 'doc-table-plain'}.intersection(classes):
+    if classes & _TRANSPARENT_TABLE_CLASSES:
         _remove_table_borders(table)
     elif 'doc-table-signature' in classes:
         _set_table_borders(table, 1.5)
-    elif 'doc-table-bordered' in classes or 'doc-table-striped' in classes:
+    elif classes & _BORDERED_TABLE_CLASSES:
         _set_table_borders(table, 1.0)
 
 
 def _remove_table_borders(table) -> None:
-    for row in table.rows:
-        for cell in row.cells:
-            _set_cell_border(cell, top=None, left=None, bottom=None, right=None)
+    for cell in _iter_unique_cells(table):
+        _set_cell_border(cell, top=None, left=None, bottom=None, right=None)
 
 
 def _set_table_borders(table, width_pt: float) -> None:
+    for cell in _iter_unique_cells(table):
+        _set_cell_border(cell, top=width_pt, left=width_pt, bottom=width_pt, right=width_pt)
+
+
+def _iter_unique_cells(table):
+    # Merged cells are reported once per grid position they cover. Track the
+    # w:tc elements themselves: ids of released lxml proxies get reused.
+    seen: set = set()
     for row in table.rows:
         for cell in row.cells:
-            _set_cell_border(cell, top=width_pt, left=width_pt, bottom=width_pt, right=width_pt)
+            tc = cell._tc
+            if tc in seen:
+                continue
+            seen.add(tc)
+            yield cell
 
 
 def _normalize_rows(rows: list[list[dict]]) -> list[list[dict]]:
@@ -1281,90 +1479,114 @@ def _normalize_rows(rows: list[list[dict]]) -> list[list[dict]]:
 
 def _expand_row(row: list[dict]) -> list[list[dict]]:
     for cell in row:
-        if isinstance(cell, dict):
-            html = cell.get('html', '')
-            if html and '<tr' in html.lower():
-                extracted = _extract_rows_from_fragment(html)
-                if extracted:
-                    return extracted
+        if isinstance(cell, dict) and cell.get('has_rows'):
+            extracted = _extract_rows_from_fragment(_events_to_html(cell.get('events') or []))
+            if extracted:
+                return extracted
     return [row]
 
 
+def _events_to_html(events: Iterable[tuple]) -> str:
+    parts: list[str] = []
+    for event in events:
+        kind = event[0]
+        if kind == 'start':
+            parts.append(_format_start_tag(event[1], event[2]))
+        elif kind == 'end':
+            parts.append(f'</{event[1]}>')
+        else:
+            parts.append(escape(event[1], quote=False))
+    return ''.join(parts)
+
+
 def _extract_rows_from_fragment(fragment: str) -> list[list[dict]]:
+    try:
+        root = lxml_html.fragment_fromstring(fragment, create_parent='div')
+    except (etree.ParserError, ValueError):
+        return []
     rows: list[list[dict]] = []
-    for row_match in re.finditer(r'<tr[^>]*>(.*?)</tr>', fragment, flags=re.IGNORECASE | re.DOTALL):
-        row_html = row_match.group(0)
+    for row in root.iter('tr'):
+        # Rows of deeper nested tables stay inside their cell's HTML.
+        if next(row.iterancestors('tr'), None) is not None:
+            continue
         cells: list[dict] = []
-        for cell_match in re.finditer(r'<(td|th)([^>]*)>(.*?)</\1>', row_html, flags=re.IGNORECASE | re.DOTALL):
-            tag = cell_match.group(1).lower()
-            attrs_raw = cell_match.group(2) or ''
-            inner_html = cell_match.group(3) or ''
-            attr_map = _parse_html_attributes(attrs_raw)
+        for cell in row.iterchildren('td', 'th'):
+            attr_map = dict(cell.attrib)
             classes = _extract_classes(attr_map)
-            cells.append({'tag': tag, 'html': inner_html, 'attrs': attr_map, 'classes': classes})
+            cells.append({'tag': cell.tag, 'html': _inner_html(cell), 'attrs': attr_map, 'classes': classes})
         if cells:
             rows.append(cells)
     return rows
 
 
-def _parse_html_attributes(raw: str) -> dict[str, str]:
-    attrs: dict[str, str] = {}
-    for match in re.finditer(r'([a-zA-Z_:][-\w\.:]*)\s*=\s*("([^"]*)"|\'([^\']*)\'|([^\s"\'=<>`]+))', raw):
-        name = match.group(1).lower()
-        value = match.group(3) or match.group(4) or match.group(5) or ''
-        attrs[name] = value
-    return attrs
+def _inner_html(element) -> str:
+    parts = [escape(element.text, quote=False)] if element.text else []
+    for child in element:
+        parts.append(lxml_html.tostring(child, encoding='unicode', with_tail=True))
+    return ''.join(parts)
+
+
+_QN_TC_BORDERS = qn('w:tcBorders')
+_QN_VAL = qn('w:val')
+_QN_SZ = qn('w:sz')
+_QN_SPACE = qn('w:space')
+_QN_COLOR = qn('w:color')
+_QN_BORDER_EDGES = {edge: qn(f'w:{edge}') for edge in ('top', 'left', 'bottom', 'right')}
 
 
 def _set_cell_border(cell, **kwargs) -> None:
     tc_pr = cell._tc.get_or_add_tcPr()
-    tc_borders = tc_pr.find(qn('w:tcBorders'))
+    tc_borders = tc_pr.find(_QN_TC_BORDERS)
     if tc_borders is None:
         tc_borders = OxmlElement('w:tcBorders')
         tc_pr.append(tc_borders)
     for edge, value in kwargs.items():
-        element = tc_borders.find(qn(f'w:{edge}'))
+        edge_tag = _QN_BORDER_EDGES.get(edge) or qn(f'w:{edge}')
+        element = tc_borders.find(edge_tag)
         if element is None:
             element = OxmlElement(f'w:{edge}')
             tc_borders.append(element)
         if value is None:
-            element.set(qn('w:val'), 'nil')
+            element.set(_QN_VAL, 'nil')
         else:
-            element.set(qn('w:val'), 'single')
-            element.set(qn('w:sz'), str(int(value * 8)))
-            element.set(qn('w:space'), '0')
-            element.set(qn('w:color'), 'auto')
+            element.set(_QN_VAL, 'single')
+            element.set(_QN_SZ, str(int(value * 8)))
+            element.set(_QN_SPACE, '0')
+            element.set(_QN_COLOR, 'auto')
 
 
-def _apply_paragraph_styling(paragraph, style_map: dict[str, str], classes: set[str]) -> None:
+def _apply_paragraph_styling(paragraph, style_map: dict[str, str], classes: frozenset[str]) -> None:
+    if not style_map and not classes:
+        return
     fmt = paragraph.paragraph_format
-    indent_value = style_map.get('margin-left') or style_map.get('padding-left')
+    get_style = style_map.get
+    indent_value = get_style('margin-left') or get_style('padding-left')
     if indent_value:
         pt_value = _css_length_to_pt(indent_value)
         if pt_value is not None:
             fmt.left_indent = Pt(pt_value)
 
-    text_indent = style_map.get('text-indent')
+    text_indent = get_style('text-indent')
     if text_indent:
         pt_value = _css_length_to_pt(text_indent)
         if pt_value is not None:
             fmt.first_line_indent = Pt(pt_value)
-    if not text_indent and ('doc-no-indent' in classes or 'no-indent' in classes or 'doc-flexline' in classes):
+    if not text_indent and (classes & _NO_INDENT_CLASSES or 'doc-flexline' in classes):
         fmt.first_line_indent = Pt(0)
 
-    margin_top = style_map.get('margin-top')
+    margin_top = get_style('margin-top')
     if margin_top:
         pt_value = _css_length_to_pt(margin_top)
         if pt_value is not None:
             fmt.space_before = Pt(pt_value)
 
-    margin_bottom = style_map.get('margin-bottom')
+    margin_bottom = get_style('margin-bottom')
     if margin_bottom:
         pt_value = _css_length_to_pt(margin_bottom)
         if pt_value is not None:
             fmt.space_after = Pt(pt_value)
 
-    line_height = style_map.get('line-height')
+    line_height = get_style('line-height')
     if line_height:
         line_height = line_height.strip()
         if line_height.endswith('%'):
@@ -1389,7 +1611,7 @@ def _apply_paragraph_styling(paragraph, style_map: dict[str, str], classes: set[
         fmt.tab_stops.add_tab_stop(Pt(420), alignment=WD_TAB_ALIGNMENT.RIGHT)
 
 
-def _apply_section_paragraph_rules(style_map: dict[str, str], classes: set[str], index: int) -> None:
+def _apply_section_paragraph_rules(style_map: dict[str, str], classes: frozenset[str], index: int) -> None:
     if 'doc-template--act' in classes:
         if index == 1:
             style_map.setdefault('text-align', 'center')
@@ -1409,7 +1631,7 @@ def _apply_section_paragraph_rules(style_map: dict[str, str], classes: set[str],
             style_map.setdefault('margin-bottom', '10pt')
 
 
-def _apply_section_table_rules(table, classes: set[str], index: int) -> None:
+def _apply_section_table_rules(table, classes: frozenset[str], index: int) -> None:
     if 'doc-template--act' in classes:
         if index == 1:
             _set_table_spacing(table, before=16)
@@ -1426,6 +1648,7 @@ def _set_table_spacing(table, *, before: float | None = None, after: float | Non
                 paragraph.paragraph_format.space_after = Pt(after)
 
 
+@lru_cache(maxsize=2048)
 def _css_length_to_pt(value: str | None) -> float | None:
     if not value:
         return None
@@ -1448,6 +1671,7 @@ def _css_length_to_pt(value: str | None) -> float | None:
         return None
 
 
+@lru_cache(maxsize=2048)
 def _parse_font_family(value: str | None) -> str | None:
     if not value:
         return None
@@ -1458,6 +1682,7 @@ def _parse_font_family(value: str | None) -> str | None:
     return None
 
 
+@lru_cache(maxsize=2048)
 def _parse_color(value: str | None) -> RGBColor | None:
     if not value:
         return None
@@ -1496,16 +1721,17 @@ def _parse_color(value: str | None) -> RGBColor | None:
     return None
 
 
+_REPEATED_SPACE_PATTERN = re.compile(r'(?<= ) ')
+
+
 def _preserve_spaces(text: str) -> str:
     if not text:
         return text
-    text = text.replace('\t', '    ')
+    text = _REPEATED_SPACE_PATTERN.sub('\u00A0', text.replace('\t', '    '))
     if text.startswith(' '):
         text = '\u00A0' + text[1:]
     if text.endswith(' '):
         text = text[:-1] + '\u00A0'
-    while '  ' in text:
-        text = text.replace('  ', ' \u00A0')
     return text
 
 
@@ -1533,24 +1759,24 @@ def _amount_to_words(value: float) -> str:
     return result.capitalize()
 
 
+_UNITS_MASC = ('', 'один', 'два', 'три', 'четыре', 'пять', 'шесть', 'семь', 'восемь', 'девять')
+_UNITS_FEM = ('', 'одна', 'две', 'три', 'четыре', 'пять', 'шесть', 'семь', 'восемь', 'девять')
+_TEENS = ('десять', 'одиннадцать', 'двенадцать', 'тринадцать', 'четырнадцать', 'пятнадцать', 'шестнадцать', 'семнадцать', 'восемнадцать', 'девятнадцать')
+_TENS = ('', 'десять', 'двадцать', 'тридцать', 'сорок', 'пятьдесят', 'шестьдесят', 'семьдесят', 'восемьдесят', 'девяносто')
+_HUNDREDS = ('', 'сто', 'двести', 'триста', 'четыреста', 'пятьсот', 'шестьсот', 'семьсот', 'восемьсот', 'девятьсот')
+_SCALES = (
+    (('рубль', 'рубля', 'рублей'), 'masc'),
+    (('тысяча', 'тысячи', 'тысяч'), 'fem'),
+    (('миллион', 'миллиона', 'миллионов'), 'masc'),
+    (('миллиард', 'миллиарда', 'миллиардов'), 'masc'),
+)
+
+
+@lru_cache(maxsize=256)
 def _number_to_words_triplets(value: int, *, gender: str, forms: tuple[str, str, str]) -> str:
     if value == 0:
         return ''
 
-    units = {
-        'masc': ['', 'один', 'два', 'три', 'четыре', 'пять', 'шесть', 'семь', 'восемь', 'девять'],
-        'fem': ['', 'одна', 'две', 'три', 'четыре', 'пять', 'шесть', 'семь', 'восемь', 'девять'],
-    }
-    teens = ['десять', 'одиннадцать', 'двенадцать', 'тринадцать', 'четырнадцать', 'пятнадцать', 'шестнадцать', 'семнадцать', 'восемнадцать', 'девятнадцать']
-    tens = ['', 'десять', 'двадцать', 'тридцать', 'сорок', 'пятьдесят', 'шестьдесят', 'семьдесят', 'восемьдесят', 'девяносто']
-    hundreds = ['', 'сто', 'двести', 'триста', 'четыреста', 'пятьсот', 'шестьсот', 'семьсот', 'восемьсот', 'девятьсот']
-    scales = [
-        (('рубль', 'рубля', 'рублей'), 'masc'),
-        (('тысяча', 'тысячи', 'тысяч'), 'fem'),
-        (('миллион', 'миллиона', 'миллионов'), 'masc'),
-        (('миллиард', 'миллиарда', 'миллиардов'), 'masc'),
-    ]
-
     words: list[str] = []
     remainder = value
     index = 0
@@ -1566,10 +1792,10 @@ def _number_to_words_triplets(value: int, *, gender: str, forms: tuple[str, str,
             current_gender = gender
             current_forms = forms
         else:
-            if index < len(scales):
-                current_forms, current_gender = scales[index]
+            if index < len(_SCALES):
+                current_forms, current_gender = _SCALES[index]
             else:
-                current_forms = (scales[-1][0][0], scales[-1][0][1], scales[-1][0][2])
+                current_forms = _SCALES[-1][0]
                 current_gender = 'masc'
 
         triplet_words = []
@@ -1579,22 +1805,23 @@ def _number_to_words_triplets(value: int, *, gender: str, forms: tuple[str, str,
         u = t_u % 10
 
         if h:
-            triplet_words.append(hundreds[h])
+            triplet_words.append(_HUNDREDS[h])
         if 10 <= t_u <= 19:
-            triplet_words.append(teens[t_u - 10])
+            triplet_words.append(_TEENS[t_u - 10])
         else:
             if t:
-                triplet_words.append(tens[t])
+                triplet_words.append(_TENS[t])
             if u:
-                gender_units = units['fem'] if current_gender == 'fem' else units['masc']
+                gender_units = _UNITS_FEM if current_gender == 'fem' else _UNITS_MASC
                 triplet_words.append(gender_units[u])
 
         if triplet_words:
             triplet_words.append(_choose_form(triplet, current_forms))
-            words.insert(0, ' '.join(filter(None, triplet_words)))
+            words.append(' '.join(filter(None, triplet_words)))
         index += 1
 
-    result = ' '.join(words).strip()
+    # Triplets are collected from the lowest scale up.
+    result = ' '.join(reversed(words)).strip()
     return result
 
 
@@ -1755,6 +1982,55 @@ def _build_default_document(context: dict[str, str]) -> str:
     ]
     return "\n".join(lines)
 
+
+_HTML_TAG_PATTERN = re.compile(r"<[^>]+>")
+_WHITESPACE_PATTERN = re.compile(r"\s+")
+_PARAGRAPH_SPLIT_PATTERN = re.compile(r"\n{2,}")
+_LEADING_BULLET_PATTERN = re.compile(r"^[\d\-•\)\.(\s]+")
+_NEEDS_ESCAPE = re.compile(r"[&<>\"']")
+_HTML_ESCAPE_TABLE = str.maketrans({"&": "&amp;", "<": "&lt;", ">": "&gt;", '"': "&quot;", "'": "&#x27;"})
+
+
+def _fast_escape(value: str) -> str:
+    # Most task descriptions contain nothing to escape; skip the copy for them.
+    # Otherwise one translate pass matches html.escape without its chained replaces.
+    return value if _NEEDS_ESCAPE.search(value) is None else value.translate(_HTML_ESCAPE_TABLE)
+
+
+def _clean_and_trim(value: str, limit: int = 1200) -> str:
+    """Strip tags and entities, collapse whitespace and cut the text to ``limit`` chars.
+
+    Text is collected segment by segment between tags and the scan stops once
+    more than ``limit`` characters are known, so long Jira dumps are not
+    cleaned in full only to be truncated.
+    """
+    text = (value or "").replace("&lt;", "<").replace("&gt;", ">").replace("&amp;", "&")
+
+    def _segments():
+        position = 0
+        for match in _HTML_TAG_PATTERN.finditer(text):
+            yield text[position:match.start()] + " "
+            position = match.end()
+        yield text[position:]
+
+    pieces: list[str] = []
+    size = 0
+    trailing_space = True  # drops leading whitespace like str.strip()
+    for segment in _segments():
+        piece = _WHITESPACE_PATTERN.sub(" ", segment)
+        if trailing_space and piece.startswith(" "):
+            piece = piece[1:]
+        if not piece:
+            continue
+        pieces.append(piece)
+        size += len(piece)
+        trailing_space = piece.endswith(" ")
+        if size - trailing_space > limit:
+            return "".join(pieces)[:limit] + "…"
+    result = "".join(pieces)
+    return result[:-1] if trailing_space and result else result
+
+
 # --- Deterministic narrative for act (paragraphs only) ---
 def _deterministic_act_html(bullets: list[dict], *, lang: str) -> str:
     """Фоллбэк без GPT: формируем абзацы строго из описаний задач.
@@ -1764,80 +2040,84 @@ def _deterministic_act_html(bullets: list[dict], *, lang: str) -> str:
         return ""
     intro = "During the reporting period the following work was completed:" if lang == "en" else "В отчетный период были выполнены следующие работы:"
 
-    def _strip_html(s: str) -> str:
-        s = s or ""
-        s = re.sub(r"&lt;", "<", s)
-        s = re.sub(r"&gt;", ">", s)
-        s = re.sub(r"&amp;", "&", s)
-        s = re.sub(r"<[^>]+>", " ", s)         # вычищаем теги в описании
-        s = re.sub(r"\s+", " ", s).strip()
-        return s
-
-    def _short(s: str, n: int = 1200) -> str:
-        s = (s or "").strip()
-        return (s[:n] + "…") if len(s) > n else s
-
-    items: list[str] = []
+    parts: list[str] = ['<div class="doc-template doc-template--act">\n<p>', intro, "</p>\n"]
+    header_size = len(parts)
     for b in bullets:
-        key = escape(b.get("key", "") or "")
-        desc = _strip_html(b.get("description", "") or "")
+        # вычищаем теги в описании и сразу обрезаем до 1200 символов
+        desc = _clean_and_trim(b.get("description", "") or "")
         if not desc:
             # аккуратный фоллбэк: берём summary, если описания нет
             desc = (b.get("summary", "") or "").strip()
+            if len(desc) > 1200:
+                desc = desc[:1200] + "…"
         if not desc:
             continue
-        items.append(f"<p><strong>{key}.</strong> {escape(_short(desc))}</p>")
-
-    if not items:
+        parts.extend((
+            "<p><strong>",
+            _fast_escape(b.get("key", "") or ""),
+            ".</strong> ",
+            _fast_escape(desc),
+            "</p>\n",
+        ))
+
+    if len(parts) == header_size:
         return ""
 
-    html = [
-        '<div class="doc-template doc-template--act">',
-        f"<p>{intro}</p>",
-        *items,
-        "</div>",
-    ]
-    return "\n".join(html)
+    parts.append("</div>")
+    return "".join(parts)
 
-def _generate_gpt_act_text(items: Iterable, payload: DocumentCreateRequest) -> str:
-    lang = (
-        payload.gptOptions.language
-        if getattr(payload, "gptOptions", None) and payload.gptOptions and payload.gptOptions.language
-        else "ru"
-    )
+
+_ACT_STYLE_HINTS_RU = {
+    "neutral": "Нейтральный деловой тон",
+    "formal": "Официальный деловой стиль",
+    "concise": "Кратко: 1-2 предложения",
+    "detailed": "Подробнее: 2-3 предложения",
+}
+_ACT_STYLE_HINTS_EN = {
+    "neutral": "Neutral business tone",
+    "formal": "Formal business wording",
+    "concise": "Concise, 1-2 sentences",
+    "detailed": "More detailed, 2-3 sentences",
+}
+_ACT_SYSTEM_PROMPT_RU = (
+    "Ты — ассистент, который помогает составлять связный текст акта выполненных работ. "
+    "Нужно написать несколько предложений, отражающих суть выполненных задач. "
+    "Не используй списки, заголовки и таблицы — только абзацы текста."
+)
+_ACT_SYSTEM_PROMPT_EN = (
+    "You are an assistant that writes cohesive summaries for statements of work. "
+    "Produce a short narrative describing the completed tasks. Use plain paragraphs only, no lists."
+)
+
+
+def _prepare_gpt_act_prompt(
+    items: Iterable, payload: DocumentCreateRequest
+) -> tuple[str, Optional[tuple[str, str]]]:
+    """Return the plain act HTML and the (system, user) GPT prompt, if there is anything to send."""
+    gpt_options = getattr(payload, "gptOptions", None)
+    lang = (gpt_options and gpt_options.language) or "ru"
+    enabled = bool(gpt_options and getattr(gpt_options, "enabled", False))
 
     bullets = _prepare_task_bullets(items)
     plain_html = _build_plain_act_html(bullets, lang=lang)
 
-    gpt_options = getattr(payload, "gptOptions", None)
-    if not (_openai_client and gpt_options and getattr(gpt_options, "enabled", False)):
+    if not (_openai_client and enabled):
         raise ServiceError(
             "gpt_disabled",
             "Не удалось сформировать связный текст акта: GPT отключён или недоступен.",
         )
 
-    candidate_bullets = [b for b in bullets if _strip_meta_lines(_strip_html_markup(b.get("description") or ""))]
+    cleaned_bullets = [(_clean_task_description(b.get("description") or ""), b) for b in bullets]
+    candidate_bullets = [entry for entry in cleaned_bullets if entry[0]]
     if not candidate_bullets:
-        candidate_bullets = bullets
+        candidate_bullets = cleaned_bullets
     if not candidate_bullets:
-        return plain_html
+        return plain_html, None
 
-    style_map = {
-        "neutral": "Нейтральный деловой тон",
-        "formal": "Официальный деловой стиль",
-        "concise": "Кратко: 1-2 предложения",
-        "detailed": "Подробнее: 2-3 предложения",
-    }
-    if lang == "en":
-        style_map = {
-            "neutral": "Neutral business tone",
-            "formal": "Formal business wording",
-            "concise": "Concise, 1-2 sentences",
-            "detailed": "More detailed, 2-3 sentences",
-        }
-    style_hint = style_map.get(getattr(gpt_options, "style", "neutral"), style_map["neutral"])
+    style_map = _ACT_STYLE_HINTS_EN if lang == "en" else _ACT_STYLE_HINTS_RU
+    style_hint = style_map.get(gpt_options.style or "neutral", style_map["neutral"])
 
-    extra_notes = getattr(gpt_options, "extraNotes", None) or ""
+    extra_notes = gpt_options.extraNotes or ""
     period = getattr(payload, "period", "") or (
         f"{getattr(payload, 'startPeriodDate', '')} — {getattr(payload, 'endPeriodDate', '')}"
         if getattr(payload, "startPeriodDate", None) and getattr(payload, "endPeriodDate", None)
@@ -1846,33 +2126,20 @@ def _generate_gpt_act_text(items: Iterable, payload: DocumentCreateRequest) -> s
     doc_type = getattr(payload, "documentType", "Акт") or "Акт"
 
     task_lines: list[str] = []
-    for idx, bullet in enumerate(candidate_bullets[:30], start=1):
+    for idx, (cleaned_description, bullet) in enumerate(candidate_bullets[:30], start=1):
         key = bullet.get("key") or ""
         summary = (bullet.get("summary") or "").strip()
-        raw_description = bullet.get("description") or ""
-        cleaned_description = _strip_meta_lines(_strip_html_markup(raw_description))
         text = cleaned_description or summary
         if not text:
             continue
         hours = bullet.get("hours")
-        line = f"{idx}. {key} — {text}"
-        if hours:
-            line += f" (затрачено {hours} ч.)"
-        task_lines.append(line)
+        hour_fragment = f" (затрачено {hours} ч.)" if hours else ""
+        task_lines.append(f"{idx}. {key} — {text}{hour_fragment}")
 
     if not task_lines:
-        return plain_html
+        return plain_html, None
 
-    system_prompt = (
-        "Ты — ассистент, который помогает составлять связный текст акта выполненных работ. "
-        "Нужно написать несколько предложений, отражающих суть выполненных задач. "
-        "Не используй списки, заголовки и таблицы — только абзацы текста."
-    )
-    if lang == "en":
-        system_prompt = (
-            "You are an assistant that writes cohesive summaries for statements of work. "
-            "Produce a short narrative describing the completed tasks. Use plain paragraphs only, no lists."
-        )
+    system_prompt = _ACT_SYSTEM_PROMPT_EN if lang == "en" else _ACT_SYSTEM_PROMPT_RU
 
     user_instructions = [
         f"Документ: {doc_type}.",
@@ -1890,35 +2157,103 @@ def _generate_gpt_act_text(items: Iterable, payload: DocumentCreateRequest) -> s
     task_section_header = "Данные задач:" if lang == "ru" else "Task data:"
     task_block = "\n".join(task_lines)
 
+    return plain_html, (system_prompt, f"{user_prompt}\n\n{task_section_header}\n{task_block}")
+
+
+_GPT_CACHE_SIZE = 1024
+_gpt_cache: "OrderedDict[str, str]" = OrderedDict()
+_gpt_cache_lock = threading.Lock()
+
+
+def _chat_completion_content(**request: Any) -> str:
+    """Return the reply text (or forced tool-call arguments) for a chat completion.
+
+    Responses are kept in a small in-process LRU keyed by a digest of the
+    model and request parameters, so re-rendering the same document does not
+    hit the API again. Empty replies are not cached.
+    """
+    key = hashlib.blake2b(
+        json.dumps({"model": OPENAI_MODEL, **request}, sort_keys=True, ensure_ascii=False).encode("utf-8"),
+        digest_size=16,
+    ).hexdigest()
+    with _gpt_cache_lock:
+        cached = _gpt_cache.get(key)
+        if cached is not None:
+            _gpt_cache.move_to_end(key)
+            return cached
+
+    response = _openai_client.chat.completions.create(model=OPENAI_MODEL, **request)
+    message = response.choices[0].message if response.choices else None
+    tool_calls = getattr(message, "tool_calls", None)
+    if tool_calls:
+        content = tool_calls[0].function.arguments or ""
+    else:
+        content = (message.content if message is not None else "") or ""
+    if content:
+        with _gpt_cache_lock:
+            _gpt_cache[key] = content
+            if len(_gpt_cache) > _GPT_CACHE_SIZE:
+                _gpt_cache.popitem(last=False)
+    return content
+
+
+def _request_gpt_act_text(system_prompt: str, user_content: str) -> Optional[str]:
     try:
-        response = _openai_client.chat.completions.create(
-            model=OPENAI_MODEL,
+        return _chat_completion_content(
             messages=[
                 {"role": "system", "content": system_prompt},
-                {
-                    "role": "user",
-                    "content": f"{user_prompt}\n\n{task_section_header}\n{task_block}",
-                },
+                {"role": "user", "content": user_content},
             ],
             max_tokens=600,
             temperature=0.7,
         )
-        generated_text = (
-            response.choices[0].message.content if response.choices else ""
-        ) or ""
     except Exception as exc:  # pragma: no cover - network/service failures
         logger.warning("GPT generation failed: %s", exc)
-        return plain_html
+        return None
 
+
+def _request_gpt_act_texts(system_prompt: str, user_contents: list[str]) -> list[Optional[str]]:
+    """Ask for several act narratives in one call; entries the model skips come back as None."""
+    sections = [f"### DOC {index}\n{content}" for index, content in enumerate(user_contents, start=1)]
+    instructions = (
+        "Ниже несколько независимых документов, каждый начинается со строки «### DOC N». "
+        "Выполни инструкции каждого документа отдельно и верни JSON-объект, "
+        "где ключ — номер документа строкой, а значение — готовый текст для него "
+        "(абзацы разделяй пустой строкой)."
+    )
+    try:
+        content = _chat_completion_content(
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": instructions + "\n\n" + "\n\n".join(sections)},
+            ],
+            max_tokens=600 * len(user_contents),
+            temperature=0.7,
+            response_format={"type": "json_object"},
+        )
+        data = json.loads(content) if content else {}
+    except Exception as exc:  # pragma: no cover - network/service failures
+        logger.warning("GPT batch generation failed: %s", exc)
+        return [None] * len(user_contents)
+    if not isinstance(data, dict):
+        return [None] * len(user_contents)
+    texts: list[Optional[str]] = []
+    for index in range(1, len(user_contents) + 1):
+        value = data.get(str(index))
+        texts.append(value if isinstance(value, str) else None)
+    return texts
+
+
+def _act_html_from_gpt_text(generated_text: str, plain_html: str) -> str:
     generated_text = generated_text.strip()
     if not generated_text:
         return plain_html
 
-    raw_paragraphs = re.split(r"\n{2,}", generated_text)
+    raw_paragraphs = _PARAGRAPH_SPLIT_PATTERN.split(generated_text)
     final_paragraphs: list[str] = []
     for paragraph in raw_paragraphs:
         clean = paragraph.strip().replace("\n", " ")
-        clean = re.sub(r"^[\d\-•\)\.(\s]+", "", clean)
+        clean = _LEADING_BULLET_PATTERN.sub("", clean)
         clean = clean.strip()
         if clean:
             final_paragraphs.append(clean)
@@ -1926,17 +2261,69 @@ def _generate_gpt_act_text(items: Iterable, payload: DocumentCreateRequest) -> s
     if not final_paragraphs:
         return plain_html
 
-    html = ["<div class=\"doc-template doc-template--act\">"]
-    html.extend(f"<p>{escape(paragraph)}</p>" for paragraph in final_paragraphs)
-    html.append("</div>")
-    return "\n".join(html)
+    parts = ["<div class=\"doc-template doc-template--act\">\n"]
+    for paragraph in final_paragraphs:
+        parts.extend(("<p>", _fast_escape(paragraph), "</p>\n"))
+    parts.append("</div>")
+    return "".join(parts)
+
+
+_ACT_BATCH_SIZE = 8
+_GPT_MAX_CONCURRENCY = 8
+
+
+def _generate_gpt_act_texts_batch(docs: list[tuple[Iterable, DocumentCreateRequest]]) -> list[str]:
+    """Generate act narratives for several documents with as few GPT calls as possible.
+
+    Documents sharing a system prompt (i.e. a language) are sent together,
+    up to ``_ACT_BATCH_SIZE`` per request, so the instructions are billed once
+    per batch instead of once per document. Separate requests run concurrently,
+    at most ``_GPT_MAX_CONCURRENCY`` at a time.
+    """
+    results: list[str] = []
+    pending: dict[str, list[tuple[int, str]]] = defaultdict(list)
+    for index, (items, payload) in enumerate(docs):
+        plain_html, prompt = _prepare_gpt_act_prompt(items, payload)
+        results.append(plain_html)
+        if prompt is not None:
+            system_prompt, user_content = prompt
+            pending[system_prompt].append((index, user_content))
+
+    jobs = [
+        (system_prompt, entries[offset:offset + _ACT_BATCH_SIZE])
+        for system_prompt, entries in pending.items()
+        for offset in range(0, len(entries), _ACT_BATCH_SIZE)
+    ]
+
+    def _run(job: tuple[str, list[tuple[int, str]]]) -> list[Optional[str]]:
+        system_prompt, chunk = job
+        if len(chunk) == 1:
+            return [_request_gpt_act_text(system_prompt, chunk[0][1])]
+        return _request_gpt_act_texts(system_prompt, [content for _, content in chunk])
+
+    if len(jobs) > 1:
+        # Requests are independent and network-bound; overlap them.
+        with ThreadPoolExecutor(max_workers=min(len(jobs), _GPT_MAX_CONCURRENCY)) as pool:
+            job_texts = list(pool.map(_run, jobs))
+    else:
+        job_texts = [_run(job) for job in jobs]
+
+    for (_, chunk), texts in zip(jobs, job_texts):
+        for (index, _), text in zip(chunk, texts):
+            if text is not None:
+                results[index] = _act_html_from_gpt_text(text, results[index])
+    return results
+
+
+def _generate_gpt_act_text(items: Iterable, payload: DocumentCreateRequest) -> str:
+    return _generate_gpt_act_texts_batch([(items, payload)])[0]
 
 
 def _collect_task_sentences(bullets: list[dict[str, object]], limit: int = 6) -> list[str]:
     sentences: list[str] = []
     for bullet in bullets:
         raw_description = bullet.get("description") or bullet.get("summary") or ""
-        cleaned = _strip_meta_lines(_strip_html_markup(str(raw_description)))
+        cleaned = _clean_task_description(str(raw_description))
         cleaned = re.sub(r"\s+", " ", cleaned).strip()
         if not cleaned:
             continue
@@ -1946,7 +2333,25 @@ def _collect_task_sentences(bullets: list[dict[str, object]], limit: int = 6) ->
     return sentences
 
 
-def _build_assignment_fallback(bullets: list[dict[str, object]], context: dict[str, str]) -> dict[str, str]:
+_ORDER_KEYS = (("orderNumber", "orderDate"), ("orderNumber1", "orderDate1"), ("orderNumber2", "orderDate2"))
+
+
+def _order_clauses(context: dict[str, str]) -> list[str]:
+    clauses: list[str] = []
+    for number_key, date_key in _ORDER_KEYS:
+        number = context.get(number_key)
+        if not number:
+            continue
+        date = context.get(date_key)
+        clauses.append(f"Приказ № {number} от {date}" if date else f"Приказ № {number}")
+    return clauses
+
+
+def _build_assignment_fallback(
+    bullets: list[dict[str, object]],
+    context: dict[str, str],
+    order_clauses: Optional[list[str]] = None,
+) -> dict[str, str]:
     project = context.get('projectName') or context.get('projectKey') or 'проекта'
     start = context.get('startPeriodDate')
     end = context.get('endPeriodDate')
@@ -1961,17 +2366,9 @@ def _build_assignment_fallback(bullets: list[dict[str, object]], context: dict[s
     sentences = _collect_task_sentences(bullets, limit=5)
     tasks_text = "; ".join(sentences) if sentences else "перечень задач согласно договору"
 
-    order_refs: list[str] = []
-    for number_key, date_key in (("orderNumber", "orderDate"), ("orderNumber1", "orderDate1"), ("orderNumber2", "orderDate2")):
-        number = context.get(number_key)
-        date = context.get(date_key)
-        if not number:
-            continue
-        clause = f"Приказ № {number}"
-        if date:
-            clause += f" от {date}"
-        order_refs.append(clause)
-    basis_fragment = "; ".join(order_refs)
+    if order_clauses is None:
+        order_clauses = _order_clauses(context)
+    basis_fragment = "; ".join(order_clauses)
 
     fallback = {
         'assignmentGoal': f"Выполнить задачи проекта {project}{period_fragment}{hours_fragment}.",
@@ -1983,6 +2380,93 @@ def _build_assignment_fallback(bullets: list[dict[str, object]], context: dict[s
     return fallback
 
 
+ASSIGNMENT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "goal": {"type": "string"},
+        "basis": {"type": "string"},
+        "purpose": {"type": "string"},
+        "requirements": {"type": "string"},
+        "appendix": {"type": "string"},
+    },
+    "required": ["goal", "basis", "purpose", "requirements", "appendix"],
+}
+
+
+_ASSIGNMENT_PROMPTS = {
+    "en": {
+        "system": (
+            "You prepare service assignment sections based strictly on the provided order and completed tasks. "
+            "Use only the supplied facts. Output must be valid JSON."
+        ),
+        "head": (
+            "Create a JSON object with keys goal, basis, purpose, requirements, appendix.\n"
+            "Each value must be one concise sentence in a formal business tone. No lists or numbering. Use '—' if data is missing.\n"
+            "Combine the development order, act narrative, and task breakdown."
+        ),
+        "instructions": (
+            "- goal: describe the main development objective, referencing the software or module.\n"
+            "- basis: if the order/basis string equals '—', craft a lawful basis using the contract and period; otherwise repeat the provided string verbatim.\n"
+            "- purpose: state the business outcome for the customer or end users.\n"
+            "- requirements: summarise the essential functional changes from the tasks in one sentence.\n"
+            "- appendix: mention that the appendix contains the detailed list of tasks, hours, and amount if available."
+        ),
+        "order_label": "Development order / basis:",
+        "narrative_label": "Narrative from the act:",
+        "tasks_label": "Task breakdown:",
+        "context_label": "Additional context:",
+    },
+    "ru": {
+        "system": (
+            "Ты готовишь разделы служебного задания, опираясь на приказ на разработку и фактические задачи. "
+            "Используй только переданные факты, не придумывай новые данные. Ответ возвращай строго в формате JSON."
+        ),
+        "head": (
+            "Сформируй JSON с ключами goal, basis, purpose, requirements, appendix.\n"
+            "Каждое значение — одно официально-деловое предложение без перечней и нумерации. Если данных нет, используй символ '—'.\n"
+            "Необходимо объединить информацию из приказа, акта и списка задач."
+        ),
+        "instructions": (
+            "- goal: обозначь ключевую цель разработки, упоминая продукт или модуль.\n"
+            "- basis: если строка «Приказ / основание» равна «—», сформулируй правовое основание с использованием договора и периода; иначе повтори её дословно.\n"
+            "- purpose: укажи, какой результат получает заказчик или пользователи.\n"
+            "- requirements: через одно предложение перечисли основные доработки и функции из задач.\n"
+            "- appendix: подчеркни, что приложение содержит детализацию задач, часы и сумму (если данные есть)."
+        ),
+        "order_label": "Приказ / основание:",
+        "narrative_label": "Описание выполненных работ из акта:",
+        "tasks_label": "Детализация задач:",
+        "context_label": "Контекст:",
+    },
+}
+
+
+def _make_assignment_prompt_builder(prompts: dict[str, str]):
+    """Specialise the assignment prompt for one language.
+
+    Everything but the four per-document blocks is joined once here, so a call
+    only concatenates those blocks between the prepared constant pieces.
+    """
+    system_prompt = prompts["system"]
+    head = f"{prompts['head']}\n\n{prompts['instructions']}\n\n{prompts['order_label']}\n"
+    narrative_head = f"\n\n{prompts['narrative_label']}\n"
+    tasks_head = f"\n\n{prompts['tasks_label']}\n"
+    context_head = f"\n\n{prompts['context_label']}\n"
+
+    def build(order_info: str, narrative_text: str, tasks_block: str, info_block: str) -> tuple[str, str]:
+        parts = [head, order_info, narrative_head, narrative_text, tasks_head, tasks_block]
+        if info_block:
+            parts.extend((context_head, info_block))
+        return system_prompt, "".join(parts)
+
+    return build
+
+
+_BUILD_ASSIGNMENT_PROMPT = {
+    language: _make_assignment_prompt_builder(prompts) for language, prompts in _ASSIGNMENT_PROMPTS.items()
+}
+
+
 def _generate_service_assignment_sections(
     *,
     bullets: list[dict[str, object]],
@@ -1992,16 +2476,22 @@ def _generate_service_assignment_sections(
     if not bullets:
         return {}
 
-    fallback = _build_assignment_fallback(bullets, context)
+    order_clauses = _order_clauses(context)
+    fallback = _build_assignment_fallback(bullets, context, order_clauses)
 
     if not _openai_client:
         return fallback
 
+    get = context.get
+    period_start = get('startPeriodDate')
+    period_end = get('endPeriodDate')
+    project_name = get('projectName')
+
     gpt_options = getattr(payload, "gptOptions", None)
     language = getattr(gpt_options, "language", "ru") if gpt_options else "ru"
 
     def _clean_text(value: object, *, limit: int | None = None) -> str:
-        cleaned = _strip_meta_lines(_strip_html_markup(str(value or "")))
+        cleaned = _clean_task_description(str(value or ""))
         cleaned = re.sub(r"\s+", " ", cleaned).strip()
         if limit and len(cleaned) > limit:
             truncated = cleaned[:limit].rsplit(" ", 1)[0].strip()
@@ -2009,35 +2499,26 @@ def _generate_service_assignment_sections(
         return cleaned
 
     order_fragments: list[str] = []
-    basis_candidate = context.get('assignmentBasis') or fallback.get('assignmentBasis')
-    if basis_candidate:
-        order_fragments.append(basis_candidate)
-    for number_key, date_key in (("orderNumber", "orderDate"), ("orderNumber1", "orderDate1"), ("orderNumber2", "orderDate2")):
-        number = context.get(number_key)
-        if not number:
-            continue
-        clause = f"Приказ № {number}"
-        date = context.get(date_key)
-        if date:
-            clause += f" от {date}"
-        order_fragments.append(clause)
-    contract_number = context.get('employeeContractNumber') or context.get('contractNumber')
-    contract_date = context.get('employeeContractDate') or context.get('contractDate')
+    seen_fragments: set[str] = set()
+
+    def _add_fragment(fragment: Optional[str]) -> None:
+        if fragment and fragment not in seen_fragments:
+            seen_fragments.add(fragment)
+            order_fragments.append(fragment)
+
+    _add_fragment(get('assignmentBasis') or fallback.get('assignmentBasis'))
+    for clause in order_clauses:
+        _add_fragment(clause)
+    contract_number = get('employeeContractNumber') or get('contractNumber')
+    contract_date = get('employeeContractDate') or get('contractDate')
     if contract_number:
-        clause = f"Договор № {contract_number}"
-        if contract_date:
-            clause += f" от {contract_date}"
-        order_fragments.append(clause)
-    period_start = context.get('startPeriodDate')
-    period_end = context.get('endPeriodDate')
+        _add_fragment(f"Договор № {contract_number} от {contract_date}" if contract_date else f"Договор № {contract_number}")
     if period_start and period_end:
-        order_fragments.append(f"Период работ {period_start} — {period_end}")
+        _add_fragment(f"Период работ {period_start} — {period_end}")
 
-    order_info = "; ".join(dict.fromkeys(fragment for fragment in order_fragments if fragment))
-    if not order_info:
-        order_info = "—"
+    order_info = "; ".join(order_fragments) or "—"
 
-    narrative_source = context.get('bodygpt') or context.get('gptBody') or ""
+    narrative_source = get('bodygpt') or get('gptBody') or ""
     narrative_text = _clean_text(narrative_source, limit=800)
     if not narrative_text:
         sentences = _collect_task_sentences(bullets, limit=5)
@@ -2046,33 +2527,31 @@ def _generate_service_assignment_sections(
         narrative_text = "—"
 
     info_lines: list[str] = []
-    project_label = context.get('projectName') or context.get('projectKey')
+    project_label = project_name or get('projectKey')
     if project_label:
         info_lines.append(f"Проект: {project_label}")
-    company_label = context.get('companyName')
+    company_label = get('companyName')
     if company_label:
         info_lines.append(f"Заказчик: {company_label}")
-    performer_label = context.get('employeeName')
+    performer_label = get('employeeName')
     if performer_label:
         info_lines.append(f"Исполнитель: {performer_label}")
-    period_start = context.get('startPeriodDate')
-    period_end = context.get('endPeriodDate')
     if period_start and period_end:
         info_lines.append(f"Период: {period_start} — {period_end}")
-    hours_label = context.get('totalHours')
+    hours_label = get('totalHours')
     if hours_label:
         info_lines.append(f"Объём часов: {hours_label}")
-    amount_label = context.get('totalAmount')
+    amount_label = get('totalAmount')
     if amount_label:
         info_lines.append(f"Сумма: {amount_label}")
-    software_label = context.get('softwareName') or context.get('projectName')
+    software_label = get('softwareName') or project_name
     if software_label:
         info_lines.append(f"ПО: {software_label}")
 
     tasks_lines: list[str] = []
     for index, bullet in enumerate(bullets[:20], start=1):
         key = str(bullet.get('key') or index)
-        description = _strip_meta_lines(_strip_html_markup(str(bullet.get('description') or '')))
+        description = _clean_task_description(str(bullet.get('description') or ''))
         if not description:
             description = str(bullet.get('summary') or '').strip()
         description = re.sub(r"\s+", " ", description).strip()
@@ -2085,75 +2564,22 @@ def _generate_service_assignment_sections(
     if not tasks_lines:
         tasks_lines.append("—")
 
-    if language == "en":
-        system_prompt = (
-            "You prepare service assignment sections based strictly on the provided order and completed tasks. "
-            "Use only the supplied facts. Output must be valid JSON."
-        )
-        user_head = (
-            "Create a JSON object with keys goal, basis, purpose, requirements, appendix.\n"
-            "Each value must be one concise sentence in a formal business tone. No lists or numbering. Use '—' if data is missing.\n"
-            "Combine the development order, act narrative, and task breakdown."
-        )
-        instructions_block = (
-            "- goal: describe the main development objective, referencing the software or module.\n"
-            "- basis: if the order/basis string equals '—', craft a lawful basis using the contract and period; otherwise repeat the provided string verbatim.\n"
-            "- purpose: state the business outcome for the customer or end users.\n"
-            "- requirements: summarise the essential functional changes from the tasks in one sentence.\n"
-            "- appendix: mention that the appendix contains the detailed list of tasks, hours, and amount if available."
-        )
-        order_label = "Development order / basis:"
-        narrative_label = "Narrative from the act:"
-        tasks_label = "Task breakdown:"
-        context_label = "Additional context:"
-    else:
-        system_prompt = (
-            "Ты готовишь разделы служебного задания, опираясь на приказ на разработку и фактические задачи. "
-            "Используй только переданные факты, не придумывай новые данные. Ответ возвращай строго в формате JSON."
-        )
-        user_head = (
-            "Сформируй JSON с ключами goal, basis, purpose, requirements, appendix.\n"
-            "Каждое значение — одно официально-деловое предложение без перечней и нумерации. Если данных нет, используй символ '—'.\n"
-            "Необходимо объединить информацию из приказа, акта и списка задач."
-        )
-        instructions_block = (
-            "- goal: обозначь ключевую цель разработки, упоминая продукт или модуль.\n"
-            "- basis: если строка «Приказ / основание» равна «—», сформулируй правовое основание с использованием договора и периода; иначе повтори её дословно.\n"
-            "- purpose: укажи, какой результат получает заказчик или пользователи.\n"
-            "- requirements: через одно предложение перечисли основные доработки и функции из задач.\n"
-            "- appendix: подчеркни, что приложение содержит детализацию задач, часы и сумму (если данные есть)."
-        )
-        order_label = "Приказ / основание:"
-        narrative_label = "Описание выполненных работ из акта:"
-        tasks_label = "Детализация задач:"
-        context_label = "Контекст:"
-
-    info_block = "\n".join(info_lines)
-    tasks_block = "\n".join(tasks_lines)
-
-    prompt_sections = [
-        user_head,
-        instructions_block,
-        f"{order_label}\n{order_info}",
-        f"{narrative_label}\n{narrative_text}",
-        f"{tasks_label}\n{tasks_block}",
-    ]
-    if info_block:
-        prompt_sections.append(f"{context_label}\n{info_block}")
-    user_prompt = "\n\n".join(prompt_sections)
+    build_prompt = _BUILD_ASSIGNMENT_PROMPT["en" if language == "en" else "ru"]
+    system_prompt, user_prompt = build_prompt(
+        order_info, narrative_text, "\n".join(tasks_lines), "\n".join(info_lines)
+    )
 
     try:
-        response = _openai_client.chat.completions.create(
-            model=OPENAI_MODEL,
+        content = _chat_completion_content(
             messages=[
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": user_prompt},
             ],
             max_tokens=400,
             temperature=0,
-            response_format={"type": "json_object"},
+            tools=[{"type": "function", "function": {"name": "emit_sections", "parameters": ASSIGNMENT_SCHEMA}}],
+            tool_choice={"type": "function", "function": {"name": "emit_sections"}},
         )
-        content = response.choices[0].message.content if response.choices else ""
         data = json.loads(content) if content else {}
     except Exception as exc:  # pragma: no cover - network/format failures
         logger.debug("GPT assignment generation failed: %s", exc)
@@ -2244,12 +2670,11 @@ def _map_metadata(raw: dict | None) -> WorkPackageMetadata:
         for value in payload.get("preparedFor", [])
         if isinstance(value, str) and str(value).strip()
     ]
-    tags = [
-        str(value).strip()
-        for value in payload.get("tags", [])
-        if isinstance(value, str) and str(value).strip()
-    ]
-    unique_tags = list(dict.fromkeys(tags))
+    unique_tags = list(dict.fromkeys(
+        tag
+        for tag in (value.strip() for value in payload.get("tags", []) if isinstance(value, str))
+        if tag
+    ))
 
     return WorkPackageMetadata(
         preparedFor=prepared_for,
@@ -2291,10 +2716,10 @@ def _map_work_package(record: orm_models.WorkPackageORM) -> WorkPackage:
     )
 
 
-def _virtual_work_package(work_package_id: str) -> WorkPackage:
+def _virtual_work_package(work_package_id: str, now: Optional[datetime] = None) -> WorkPackage:
     return WorkPackage(
         id=work_package_id,
-        createdAt=datetime.utcnow(),
+        createdAt=now or datetime.now(timezone.utc),
         period="",
         projectKey="",
         projectName="",
@@ -2366,23 +2791,30 @@ def _map_v2_document_to_work_package(
     )
 
 
+def _scope_task_update(session: Session, statement):
+    # The workspace filter hook only scopes SELECTs, so bulk updates carry it explicitly.
+    workspace_scope = session.info.get("workspace_scope")
+    workspace_id = session.info.get("workspace_id")
+    if workspace_scope:
+        return statement.where(orm_models.TaskORM.workspace_id.in_(tuple(workspace_scope)))
+    if workspace_id:
+        return statement.where(orm_models.TaskORM.workspace_id == workspace_id)
+    return statement
+
+
 def release_work_package_tasks(session: Session, work_package_id: str) -> WorkPackage:
     def _release_tasks_by_prefix(prefix: str) -> None:
-        tasks = (
-            session.execute(
-                select(orm_models.TaskORM).where(orm_models.TaskORM.work_package_id.like(f"{prefix}%"))
-            )
-            .scalars()
-            .all()
+        statement = (
+            update(orm_models.TaskORM)
+            .where(orm_models.TaskORM.work_package_id.like(f"{prefix}%"))
+            .values(work_package_id=None, force_included=False)
         )
-        for task in tasks:
-            task.work_package_id = None
-            task.force_included = False
-        if tasks:
-            session.flush()
+        session.flush()
+        session.execute(_scope_task_update(session, statement))
 
-    if work_package_id.startswith("package-v2-"):
-        suffix = work_package_id.removeprefix("package-v2-")
+    prefix_v2 = "package-v2-"
+    if work_package_id.startswith(prefix_v2):
+        suffix = work_package_id[len(prefix_v2):]
         if not suffix:
             raise ValueError("Work package not found")
         _release_tasks_by_prefix(f"package:{suffix}")
@@ -2411,21 +2843,38 @@ def _map_assignee(user: orm_models.UserORM | None) -> DocumentAssignee | None:
     )
 
 
+_VALID_APPROVAL_STATUSES = frozenset({
+    "draft",
+    "pending_performer",
+    "pending_manager",
+    "manager_approved",
+    "rejected_performer",
+    "rejected_manager",
+    "final",
+})
+# The performer may still be reassigned in these statuses.
+_PERFORMER_EDITABLE_STATUSES = frozenset({"draft", "pending_performer", "rejected_performer"})
+# Waiting on the performer; losing the performer sends the document back to draft.
+_PERFORMER_PENDING_STATUSES = frozenset({"pending_performer", "rejected_performer"})
+_MANAGER_APPROVED_STATUSES = frozenset({"manager_approved", "final"})
+
+# Relationships read by _map_document; list queries load them up front so
+# mapping N records does not issue N lazy selects per relationship.
+_DOCUMENT_RECORD_LOADERS = (
+    selectinload(orm_models.DocumentRecordORM.work_package),
+    selectinload(orm_models.DocumentRecordORM.workspace),
+    selectinload(orm_models.DocumentRecordORM.performer_assignee),
+    selectinload(orm_models.DocumentRecordORM.manager_assignee),
+)
+
+
 def _map_document(record: orm_models.DocumentRecordORM) -> DocumentRecord:
     work_package = record.work_package
     snapshots_source = work_package.task_snapshots if work_package else record.metadata_json.get("taskSnapshots", [])
     status = (record.approval_status or "draft").strip()
     if status == "performer_approved":
         status = "pending_manager"
-    elif status not in {
-        "draft",
-        "pending_performer",
-        "pending_manager",
-        "manager_approved",
-        "rejected_performer",
-        "rejected_manager",
-        "final",
-    }:
+    elif status not in _VALID_APPROVAL_STATUSES:
         # fallback for legacy values
         status = "draft"
 
@@ -2496,48 +2945,82 @@ def _map_document(record: orm_models.DocumentRecordORM) -> DocumentRecord:
 
 
 def _hydrate_document_assignees(session: Session, record: orm_models.DocumentRecordORM) -> None:
-    performer_missing = not record.performer_assignee_id
-    manager_missing = not record.manager_assignee_id
-    if not performer_missing and not manager_missing:
-        return
-
-    contractor = session.get(orm_models.IndividualORM, record.contractor_id)
-    if not contractor:
-        return
+    _hydrate_document_assignees_bulk(session, [record])
 
-    updated = False
 
-    performer_user, _ = ensure_individual_account(
-        session,
-        contractor,
-        create_missing=False,
-        allow_email_reassign=True,
-    )
-
-    if performer_missing and performer_user:
-        record.performer_assignee = performer_user
-        record.performer_assignee_id = performer_user.id
-        updated = True
+def _hydrate_document_assignees_bulk(
+    session: Session,
+    records: Iterable[orm_models.DocumentRecordORM],
+) -> None:
+    missing = [
+        record
+        for record in records
+        if (not record.performer_assignee_id or not record.manager_assignee_id) and record.contractor_id
+    ]
+    if not missing:
+        return
 
-    if manager_missing and contractor.default_manager_id:
-        manager = session.get(orm_models.IndividualORM, contractor.default_manager_id)
-        if manager is not None:
-            manager_user, _ = ensure_individual_account(
+    def _load_individuals(ids: set) -> dict:
+        if not ids:
+            return {}
+        # ensure_individual_account reads ``individual.user``; load the users in the same batch.
+        individuals = session.scalars(
+            select(orm_models.IndividualORM)
+            .where(orm_models.IndividualORM.id.in_(ids))
+            .options(selectinload(orm_models.IndividualORM.user))
+        ).all()
+        return {individual.id: individual for individual in individuals}
+
+    users: dict = {}
+
+    def _account_user(individual: orm_models.IndividualORM):
+        if individual.id not in users:
+            users[individual.id], _ = ensure_individual_account(
                 session,
-                manager,
+                individual,
                 create_missing=False,
                 allow_email_reassign=True,
             )
-            if manager_user is not None:
-                record.manager_assignee = manager_user
-                record.manager_assignee_id = manager_user.id
-                updated = True
+        return users[individual.id]
+
+    contractors = _load_individuals({record.contractor_id for record in missing})
+    manager_ids = set()
+    for record in missing:
+        contractor = contractors.get(record.contractor_id)
+        if not record.manager_assignee_id and contractor and contractor.default_manager_id:
+            manager_ids.add(contractor.default_manager_id)
+    managers = _load_individuals(manager_ids)
+
+    for record in missing:
+        contractor = contractors.get(record.contractor_id)
+        if not contractor:
+            continue
+        columns: dict[str, object] = {}
+        relations: dict[str, object] = {}
 
-    if updated:
-        session.flush()
+        performer_user = _account_user(contractor)
+        if not record.performer_assignee_id and performer_user:
+            columns["performer_assignee_id"] = performer_user.id
+            relations["performer_assignee"] = performer_user
+
+        if not record.manager_assignee_id and contractor.default_manager_id:
+            manager = managers.get(contractor.default_manager_id)
+            if manager is not None:
+                manager_user = _account_user(manager)
+                if manager_user is not None:
+                    columns["manager_assignee_id"] = manager_user.id
+                    relations["manager_assignee"] = manager_user
+
+        if columns:
+            _store_derived_document_fields(session, record, columns, relations)
 
 
 def _safe_float(value: object, *, precision: int | None = None) -> float:
+    value_type = type(value)
+    if value_type is float or value_type is int:
+        # JSON numbers from task tables are the common case; skip the generic coercion.
+        result = float(value)
+        return float(round(result, precision)) if precision is not None else result
     if value is None:
         return 0.0
     if isinstance(value, Decimal):
@@ -2552,6 +3035,17 @@ def _safe_float(value: object, *, precision: int | None = None) -> float:
     return result
 
 
+def _generated_task_id(project_key: str, raw: dict, occurrences: dict[str, int]) -> str:
+    # Stable across re-imports, so the same untracked task merges across package documents.
+    # ``occurrences`` numbers repeated rows within one document, so two rows that only
+    # share a summary keep distinct ids.
+    base = f"{project_key}|{raw.get('key') or ''}|{raw.get('summary') or ''}"
+    occurrence = occurrences.get(base, 0)
+    occurrences[base] = occurrence + 1
+    source = f"{base}|{occurrence}"
+    return f"gen-{hashlib.blake2b(source.encode('utf-8'), digest_size=8).hexdigest()}"
+
+
 def _build_task_snapshots_from_items(
     items: List[dict],
     *,
@@ -2559,37 +3053,145 @@ def _build_task_snapshots_from_items(
     project_key: str,
     project_name: str,
 ) -> List[TaskCostSnapshot]:
+    fallback = float(fallback_rate)
     snapshots: List[TaskCostSnapshot] = []
+    append = snapshots.append
+    generated_occurrences: dict[str, int] = {}
     for raw in items:
         if not isinstance(raw, dict):
             continue
-        hours = _safe_float(raw.get("hours"), precision=4)
-        rate = _safe_float(raw.get("hourlyRate"), precision=4)
-        if rate <= 0 and fallback_rate > 0:
-            rate = fallback_rate
-        amount = _safe_float(raw.get("amount"), precision=2)
+        get = raw.get
+        hours = _safe_float(get("hours"), precision=4)
+        rate = _safe_float(get("hourlyRate"), precision=4)
+        if rate <= 0 and fallback > 0:
+            rate = fallback
+        amount = _safe_float(get("amount"), precision=2)
         if amount <= 0 and rate > 0 and hours > 0:
             amount = round(rate * hours, 2)
-
-        snapshot = TaskCostSnapshot(
-            id=str(raw.get("id") or raw.get("jira_id") or uuid4()),
-            key=str(raw.get("key") or raw.get("jira_id") or "UNKNOWN"),
-            title=str(raw.get("summary") or ""),
-            description=str(raw.get("description")) if isinstance(raw.get("description"), str) else None,
-            status=str(raw.get("status") or ""),
+        description = get("description")
+
+        # Every value is already coerced to its field type, so skip validation.
+        append(TaskCostSnapshot.construct(
+            id=str(get("id") or get("jira_id") or _generated_task_id(project_key, raw, generated_occurrences)),
+            key=str(get("key") or get("jira_id") or "UNKNOWN"),
+            title=str(get("summary") or ""),
+            description=description if isinstance(description, str) else None,
+            status=str(get("status") or ""),
             hours=round(hours, 2),
-            billable=bool(raw.get("billable", True)),
-            forceIncluded=bool(raw.get("forceIncluded") or raw.get("force_included") or False),
-            projectKey=str(raw.get("projectKey") or raw.get("project_key") or project_key),
-            projectName=str(raw.get("projectName") or raw.get("project_name") or project_name),
+            billable=bool(get("billable", True)),
+            forceIncluded=bool(get("forceIncluded") or get("force_included") or False),
+            projectKey=str(get("projectKey") or get("project_key") or project_key),
+            projectName=str(get("projectName") or get("project_name") or project_name),
             hourlyRate=round(rate, 2),
             amount=round(amount, 2),
             categories=None,
-        )
-        snapshots.append(snapshot)
+        ))
     return snapshots
 
 
+def _timesheet_task_item(entry: dict) -> dict:
+    task_id = entry.get("jira_id") or entry.get("id")
+    return {
+        "id": task_id,
+        "jira_id": task_id,
+        "key": task_id,
+        "summary": entry.get("summary") or "",
+        "status": entry.get("status") or "",
+        "hours": entry.get("hours"),
+        "billable": entry.get("billable", True),
+    }
+
+
+def _year_month(value: date) -> str:
+    # Same as strftime("%Y-%m") without the locale-aware formatting machinery.
+    return f"{value.year:04d}-{value.month:02d}"
+
+
+@lru_cache(maxsize=4096)
+def _parse_iso_datetime(text: str) -> datetime | None:
+    # Approval timestamps repeat across the timeline entries of a listing; parse each once.
+    text = text.strip()
+    if not text:
+        return None
+    try:
+        return datetime.fromisoformat(text.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+
+
+def _parse_dt(value: object) -> datetime | None:
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, str):
+        return _parse_iso_datetime(value)
+    if isinstance(value, (int, float)):
+        try:
+            return datetime.fromtimestamp(float(value))
+        except (ValueError, OSError):
+            return None
+    return None
+
+
+def _parse_assignee(entry: object) -> DocumentAssignee | None:
+    if not isinstance(entry, dict):
+        return None
+    assignee_id = entry.get("id")
+    email = entry.get("email")
+    full_name = entry.get("full_name") or entry.get("fullName")
+    if not isinstance(assignee_id, str) or not assignee_id:
+        return None
+    if not isinstance(email, str) or not email:
+        return None
+    if not isinstance(full_name, str) or not full_name.strip():
+        full_name = email
+    return DocumentAssignee(id=assignee_id, email=email, full_name=full_name)
+
+
+def _assignee_to_meta(obj: DocumentAssignee | None) -> dict | None:
+    if obj is None:
+        return None
+    return {
+        "id": obj.id,
+        "email": obj.email,
+        "full_name": obj.fullName or obj.email,
+    }
+
+
+def _extract_workspace_id(source: object) -> str | None:
+    if isinstance(source, str):
+        candidate = source.strip()
+        return candidate or None
+    if isinstance(source, dict):
+        candidate: object = (
+            source.get("workspace_id")
+            or source.get("workspaceId")
+            or source.get("workspace")
+        )
+        if isinstance(candidate, dict):
+            inner = candidate.get("id") or candidate.get("workspace_id") or candidate.get("workspaceId")
+            candidate = inner
+        if isinstance(candidate, str):
+            candidate = candidate.strip()
+            if candidate:
+                return candidate
+    return None
+
+
+_LEGACY_CONTRACT_CACHE_KEY = "legacy_contract_cache"
+
+
+def _get_legacy_contract(session: Session, contract_id: str) -> orm_models.ContractORM | None:
+    # Documents of one package share a contract; remember hits and misses for the session.
+    cache = session.info.setdefault(_LEGACY_CONTRACT_CACHE_KEY, {})
+    if contract_id in cache:
+        return cache[contract_id]
+    contract = session.get(orm_models.ContractORM, contract_id)
+    if contract is not None and object_session(contract) is None:
+        contract = session.merge(contract, load=False)
+    cache[contract_id] = contract
+    return contract
+
+
 def _map_closing_document(session: Session, record: orm_models.DocumentV2ORM) -> DocumentRecord:
     meta = record.meta if isinstance(record.meta, dict) else {}
     package = record.package
@@ -2597,7 +3199,7 @@ def _map_closing_document(session: Session, record: orm_models.DocumentV2ORM) ->
     performer_v2 = record.performer or (contract_v2.performer if contract_v2 else None)
     company = contract_v2.company if contract_v2 else None
 
-    approval_meta = meta.get("approval") if isinstance(meta, dict) else None
+    approval_meta = meta.get("approval")
     approval_status = "draft"
     submitted_at = None
     manager_approved_at = None
@@ -2611,72 +3213,22 @@ def _map_closing_document(session: Session, record: orm_models.DocumentV2ORM) ->
     performer_assignee_obj: DocumentAssignee | None = None
     manager_assignee_obj: DocumentAssignee | None = None
 
-    def _parse_dt(value: object) -> datetime | None:
-        if isinstance(value, datetime):
-            return value
-        if isinstance(value, str):
-            text = value.strip()
-            if not text:
-                return None
-            try:
-                return datetime.fromisoformat(text.replace("Z", "+00:00"))
-            except ValueError:
-                return None
-        if isinstance(value, (int, float)):
-            try:
-                return datetime.fromtimestamp(float(value))
-            except (ValueError, OSError):
-                return None
-        return None
-
-    performer_assignee_obj: DocumentAssignee | None = None
-    manager_assignee_obj: DocumentAssignee | None = None
-
     approval_changed = False
 
     if isinstance(approval_meta, dict):
         approval_status = _normalize_v2_status(approval_meta.get("status"))
 
-        def _parse_assignee(entry: object) -> DocumentAssignee | None:
-            if not isinstance(entry, dict):
-                return None
-            assignee_id = entry.get("id")
-            email = entry.get("email")
-            full_name = entry.get("full_name") or entry.get("fullName")
-            if not isinstance(assignee_id, str) or not assignee_id:
-                return None
-            if not isinstance(email, str) or not email:
-                return None
-            if not isinstance(full_name, str) or not full_name.strip():
-                full_name = email
-            return DocumentAssignee(id=assignee_id, email=email, full_name=full_name)
-
-        performer_assignee_obj = _parse_assignee(approval_meta.get("performer_assignee"))
-        manager_assignee_obj = _parse_assignee(approval_meta.get("manager_assignee"))
-
-        def _parse_assignee(entry: object) -> DocumentAssignee | None:
-            if not isinstance(entry, dict):
-                return None
-            assignee_id = entry.get("id")
-            email = entry.get("email")
-            full_name = entry.get("full_name") or entry.get("fullName")
-            if not isinstance(assignee_id, str) or not assignee_id:
-                return None
-            if not isinstance(email, str) or not email:
-                return None
-            if not isinstance(full_name, str) or not full_name.strip():
-                full_name = email
-            return DocumentAssignee(id=assignee_id, email=email, full_name=full_name)
-
         performer_assignee_obj = _parse_assignee(approval_meta.get("performer_assignee"))
         manager_assignee_obj = _parse_assignee(approval_meta.get("manager_assignee"))
 
         timeline = approval_meta.get("timeline") or approval_meta.get("history") or approval_meta.get("notes")
         if isinstance(timeline, list):
+            now_fallback = datetime.utcnow()
+            normalize_status = _normalize_v2_status
             for entry in timeline:
                 if not isinstance(entry, dict):
                     continue
-                status_entry = _normalize_v2_status(entry.get("status") or approval_status)
+                status_entry = normalize_status(entry.get("status") or approval_status)
                 timestamp_entry = _parse_dt(
                     entry.get("timestamp")
                     or entry.get("time")
@@ -2688,8 +3240,8 @@ def _map_closing_document(session: Session, record: orm_models.DocumentV2ORM) ->
                 role = entry.get("role") or entry.get("actor_role") or ""
 
                 approval_notes.append(
-                    DocumentApprovalNote(
-                        timestamp=timestamp_entry or datetime.utcnow(),
+                    DocumentApprovalNote.construct(
+                        timestamp=timestamp_entry or now_fallback,
                         author=str(author or ""),
                         role=str(role or ""),
                         status=status_entry,
@@ -2710,18 +3262,12 @@ def _map_closing_document(session: Session, record: orm_models.DocumentV2ORM) ->
         finalized_at = record.updated_at or record.created_at
 
 
-    legacy_contract_id = None
-    if isinstance(meta, dict):
-        legacy_contract_id = meta.get("legacy_contract_id") or meta.get("legacyContractId")
-    legacy_contract = (
-        session.get(orm_models.ContractORM, str(legacy_contract_id))
-        if legacy_contract_id
-        else None
-    )
-    if legacy_contract is not None and object_session(legacy_contract) is None:
-        legacy_contract = session.merge(legacy_contract, load=False)
+    legacy_contract_id = meta.get("legacy_contract_id") or meta.get("legacyContractId")
+    legacy_contract = _get_legacy_contract(session, str(legacy_contract_id)) if legacy_contract_id else None
     legacy_performer = None
-    if legacy_contract and legacy_contract.contractor_id:
+    # Assignees already stored on the approval meta need no rehydration from the legacy contract.
+    needs_assignees = performer_assignee_obj is None or manager_assignee_obj is None
+    if needs_assignees and legacy_contract and legacy_contract.contractor_id:
         legacy_performer = session.get(orm_models.IndividualORM, legacy_contract.contractor_id)
         if legacy_performer is not None:
             ensure_individual_account(
@@ -2738,7 +3284,6 @@ def _map_closing_document(session: Session, record: orm_models.DocumentV2ORM) ->
             email=user.email,
             full_name=user.full_name or user.email,
         )
-        approval_changed = True
 
     if manager_assignee_obj is None and legacy_performer and legacy_performer.default_manager_id:
         manager = session.get(orm_models.IndividualORM, legacy_performer.default_manager_id)
@@ -2755,55 +3300,35 @@ def _map_closing_document(session: Session, record: orm_models.DocumentV2ORM) ->
                     email=manager.user.email,
                     full_name=manager.user.full_name or manager.user.email,
                 )
-                approval_changed = True
-
-    def _assignee_to_meta(obj: DocumentAssignee | None) -> dict | None:
-        if obj is None:
-            return None
-        return {
-            "id": obj.id,
-            "email": obj.email,
-            "full_name": obj.fullName or obj.email,
-        }
 
+    # Only write back when the stored assignees actually differ; listings are otherwise read-only.
     if isinstance(approval_meta, dict):
-        meta_performer = _assignee_to_meta(performer_assignee_obj)
-        if meta_performer and approval_meta.get("performer_assignee") != meta_performer:
-            approval_meta["performer_assignee"] = meta_performer
-            approval_changed = True
-        meta_manager = _assignee_to_meta(manager_assignee_obj)
-        if meta_manager and approval_meta.get("manager_assignee") != meta_manager:
-            approval_meta["manager_assignee"] = meta_manager
-            approval_changed = True
+        if performer_assignee_obj is not None:
+            meta_performer = _assignee_to_meta(performer_assignee_obj)
+            if approval_meta.get("performer_assignee") != meta_performer:
+                approval_meta["performer_assignee"] = meta_performer
+                approval_changed = True
+        if manager_assignee_obj is not None:
+            meta_manager = _assignee_to_meta(manager_assignee_obj)
+            if approval_meta.get("manager_assignee") != meta_manager:
+                approval_meta["manager_assignee"] = meta_manager
+                approval_changed = True
 
     if approval_changed:
         meta["approval"] = approval_meta
-        record.meta = meta
-        flag_modified(record, "meta")
-        session.flush()
+        _store_derived_document_fields(session, record, {"meta": meta})
 
     project_key = str(meta.get("project_key") or meta.get("projectKey") or "")
     project_name = str(meta.get("project_name") or meta.get("projectName") or project_key)
 
-    task_items_raw: List[dict] = []
     raw_items = meta.get("task_items") or meta.get("taskItems")
-    if isinstance(raw_items, list):
-        task_items_raw = [item for item in raw_items if isinstance(item, dict)]
+    task_items_raw: List[dict] = (
+        [item for item in raw_items if isinstance(item, dict)] if isinstance(raw_items, list) else []
+    )
     if not task_items_raw and record.timesheet and isinstance(record.timesheet.task_table, list):
-        for entry in record.timesheet.task_table:
-            if not isinstance(entry, dict):
-                continue
-            task_items_raw.append(
-                {
-                    "id": entry.get("jira_id") or entry.get("id"),
-                    "jira_id": entry.get("jira_id") or entry.get("id"),
-                    "key": entry.get("jira_id") or entry.get("id"),
-                    "summary": entry.get("summary") or "",
-                    "status": entry.get("status") or "",
-                    "hours": entry.get("hours"),
-                    "billable": entry.get("billable", True),
-                }
-            )
+        task_items_raw = [
+            _timesheet_task_item(entry) for entry in record.timesheet.task_table if isinstance(entry, dict)
+        ]
 
     raw_hours_total = sum(_safe_float(item.get("hours")) for item in task_items_raw)
     hours_total = _safe_float(record.hours)
@@ -2834,23 +3359,26 @@ def _map_closing_document(session: Session, record: orm_models.DocumentV2ORM) ->
     vat_amount = _safe_float(record.vat_amount, precision=2)
     amount_wo_vat = _safe_float(record.amount_wo_vat, precision=2)
     vat_percent = _safe_float(meta.get("vat_percent") or meta.get("vatPercent"), precision=2)
-    if vat_percent <= 0 and amount_wo_vat > 0 and vat_amount > 0:
-        vat_percent = round((vat_amount / amount_wo_vat) * 100, 2)
-    elif vat_percent <= 0 and amount_total > 0 and vat_amount > 0:
-        vat_percent = round((vat_amount / (amount_total - vat_amount)) * 100, 2) if amount_total > vat_amount else 0.0
+    if vat_percent <= 0 and vat_amount > 0:
+        vat_base = amount_wo_vat if amount_wo_vat > 0 else max(amount_total - vat_amount, 0.0)
+        if vat_base > 0:
+            vat_percent = round((vat_amount / vat_base) * 100, 2)
+        elif amount_total > 0:
+            vat_percent = 0.0
 
     vat_included = vat_amount > 0
 
     prepared_for = DOC_V2_AUDIENCE.get(record.doc_type, ["act"])
+    package_period = _year_month(package.period_start) if package and package.period_start else ""
     tags = [
         tag
-        for tag in {
+        for tag in dict.fromkeys((
             "package-v2",
             record.doc_type.lower() if record.doc_type else "",
             project_key,
             project_name,
-            package.period_start.strftime("%Y-%m") if package and package.period_start else "",
-        }
+            package_period,
+        ))
         if tag
     ]
 
@@ -2909,11 +3437,11 @@ def _map_closing_document(session: Session, record: orm_models.DocumentV2ORM) ->
 
     period_value = None
     if record.period_start:
-        period_value = record.period_start.strftime("%Y-%m")
-    elif package and package.period_start:
-        period_value = package.period_start.strftime("%Y-%m")
+        period_value = _year_month(record.period_start)
+    elif package_period:
+        period_value = package_period
     else:
-        period_value = record.created_at.strftime("%Y-%m") if record.created_at else ""
+        period_value = _year_month(record.created_at) if record.created_at else ""
 
     performer_type = str(
         meta.get("performer_type")
@@ -2921,25 +3449,6 @@ def _map_closing_document(session: Session, record: orm_models.DocumentV2ORM) ->
         or "gph"
     )
 
-    def _extract_workspace_id(source: object) -> str | None:
-        if isinstance(source, str):
-            candidate = source.strip()
-            return candidate or None
-        if isinstance(source, dict):
-            candidate: object = (
-                source.get("workspace_id")
-                or source.get("workspaceId")
-                or source.get("workspace")
-            )
-            if isinstance(candidate, dict):
-                inner = candidate.get("id") or candidate.get("workspace_id") or candidate.get("workspaceId")
-                candidate = inner
-            if isinstance(candidate, str):
-                candidate = candidate.strip()
-                if candidate:
-                    return candidate
-        return None
-
     workspace_id = _extract_workspace_id(meta)
     if workspace_id is None and package is not None:
         workspace_id = _extract_workspace_id(getattr(package, "meta", None))
@@ -3000,24 +3509,54 @@ def _map_closing_document(session: Session, record: orm_models.DocumentV2ORM) ->
 
 
 def _deduplicate_notes(notes: Iterable[DocumentApprovalNote]) -> list[DocumentApprovalNote]:
-    seen: set[tuple] = set()
-    ordered: list[DocumentApprovalNote] = []
-    for note in sorted(
-        notes,
+    # Dedup first (keeping the earliest occurrence) so only unique notes get sorted.
+    unique: dict[tuple, DocumentApprovalNote] = {}
+    for note in notes:
+        unique.setdefault((note.timestamp, note.status, note.author, note.role, note.message), note)
+    return sorted(
+        unique.values(),
         key=lambda item: (item.timestamp or datetime.min, item.status, item.author, item.message),
-    ):
-        signature = (
-            (note.timestamp.isoformat() if note.timestamp else None),
-            note.status,
-            note.author,
-            note.role,
-            note.message,
+    )
+
+
+def _prefetch_legacy_contracts(
+    session: Session,
+    records: Iterable[orm_models.DocumentV2ORM],
+) -> None:
+    """Load legacy contracts and their people for a batch of closing documents.
+
+    ``_map_closing_document`` resolves them through ``_get_legacy_contract``;
+    loading them up front fills that cache instead of issuing one query per
+    document.
+    """
+    contract_ids = set()
+    for record in records:
+        meta = record.meta
+        if isinstance(meta, dict):
+            legacy_contract_id = meta.get("legacy_contract_id") or meta.get("legacyContractId")
+            if legacy_contract_id:
+                contract_ids.add(str(legacy_contract_id))
+    if not contract_ids:
+        return
+    cache = session.info.setdefault(_LEGACY_CONTRACT_CACHE_KEY, {})
+    contract_ids.difference_update(cache)
+    if not contract_ids:
+        return
+    contractor = selectinload(orm_models.ContractORM.contractor)
+    contracts = session.execute(
+        select(orm_models.ContractORM)
+        .where(orm_models.ContractORM.id.in_(contract_ids))
+        .options(
+            contractor.selectinload(orm_models.IndividualORM.user),
+            contractor.selectinload(orm_models.IndividualORM.default_manager).selectinload(
+                orm_models.IndividualORM.user
+            ),
         )
-        if signature in seen:
-            continue
-        seen.add(signature)
-        ordered.append(note)
-    return ordered
+    ).scalars().all()
+    for contract in contracts:
+        cache[contract.id] = contract
+    for contract_id in contract_ids:
+        cache.setdefault(contract_id, None)
 
 
 def _merge_closing_documents(
@@ -3030,72 +3569,78 @@ def _merge_closing_documents(
     mapped_documents = [_map_closing_document(session, record) for record in records]
     base_document = mapped_documents[0]
 
-    # Aggregate files with deterministic ordering
-    file_entries: list[tuple[int, DocumentFile]] = []
+    # Fold every per-document aggregate in a single pass over the mapped documents.
+    # Best (priority, label) entry per file id, plus its arrival order as the final tiebreaker.
+    best_files: dict[str, tuple[int, str, int, DocumentFile]] = {}
     doc_labels: list[str] = []
+    snapshot_map: dict[str, TaskCostSnapshot] = {}
+    max_amount = base_document.amount
+    max_hours = base_document.totalHours
+    vat_amount = 0.0
+    max_vat_percent = 0.0
+    vat_included = False
+    tags: list[str] = []
+    prepared_for: list[str] = []
+    include_timesheet = False
+    aggregated_status = base_document.approvalStatus
+    aggregated_priority = _STATUS_PRIORITY.get(aggregated_status, 10)
+    collected_notes: list[DocumentApprovalNote] = []
+
+    doc_priority_get = DOC_V2_PRIORITY.get
+    doc_label_get = DOC_V2_TYPE_LABELS.get
+    file_sequence = 0
+    status_priority_get = _STATUS_PRIORITY.get
     for record, mapped in zip(records, mapped_documents):
-        priority = DOC_V2_PRIORITY.get(record.doc_type or "", 100)
+        doc_type = record.doc_type or ""
+        priority = doc_priority_get(doc_type, 100)
         for file_entry in mapped.files:
-            file_entries.append((priority, file_entry))
-        label = DOC_V2_TYPE_LABELS.get(record.doc_type or "", "Документ")
-        doc_labels.append(label)
-    file_entries.sort(key=lambda item: (item[0], item[1].label))
-    merged_files: dict[str, DocumentFile] = {}
-    for _, file_entry in file_entries:
-        merged_files.setdefault(file_entry.id, file_entry)
-
-    # Aggregate task snapshots
-    snapshot_map: dict[str, TaskCostSnapshot] = {}
-    for mapped in mapped_documents:
+            current = best_files.get(file_entry.id)
+            if current is None or (priority, file_entry.label) < current[:2]:
+                best_files[file_entry.id] = (priority, file_entry.label, file_sequence, file_entry)
+            file_sequence += 1
+        doc_labels.append(doc_label_get(doc_type, "Документ"))
+
         for snapshot in mapped.taskSnapshots:
             snapshot_map[snapshot.id] = snapshot
 
+        if mapped.amount > max_amount:
+            max_amount = mapped.amount
+        if mapped.totalHours > max_hours:
+            max_hours = mapped.totalHours
+        if mapped.vatAmount > vat_amount:
+            vat_amount = mapped.vatAmount
+        if mapped.vatPercent > max_vat_percent:
+            max_vat_percent = mapped.vatPercent
+        if mapped.vatIncluded or mapped.vatAmount > 0:
+            vat_included = True
+        if mapped.includeTimesheet:
+            include_timesheet = True
+
+        tags.extend(mapped.metadata.tags or [])
+        prepared_for.extend(mapped.metadata.preparedFor or [])
+
+        status_priority = status_priority_get(mapped.approvalStatus, 10)
+        if status_priority < aggregated_priority:
+            aggregated_status = mapped.approvalStatus
+            aggregated_priority = status_priority
+        collected_notes.extend(mapped.approvalNotes or [])
+
+    merged_files = [entry[3] for entry in sorted(best_files.values(), key=lambda entry: entry[:3])]
+
     unique_snapshots = list(snapshot_map.values())
     unique_snapshots.sort(key=lambda snapshot: snapshot.id)
 
     total_hours = round(sum(snapshot.hours for snapshot in unique_snapshots), 2)
     total_amount = round(sum(snapshot.amount for snapshot in unique_snapshots), 2)
     if total_amount <= 0:
-        total_amount = max((mapped.amount for mapped in mapped_documents), default=0.0)
+        total_amount = max_amount
     if total_hours <= 0:
-        total_hours = max((mapped.totalHours for mapped in mapped_documents), default=0.0)
-
-    vat_amount_candidates = [mapped.vatAmount for mapped in mapped_documents if mapped.vatAmount > 0]
-    vat_amount = max(vat_amount_candidates, default=0.0)
-    vat_percent_candidates = [mapped.vatPercent for mapped in mapped_documents if mapped.vatPercent > 0]
-    vat_percent = max(vat_percent_candidates, default=base_document.vatPercent)
-    vat_included = any(mapped.vatIncluded or mapped.vatAmount > 0 for mapped in mapped_documents)
+        total_hours = max_hours
 
-    tags: list[str] = []
-    prepared_for: list[str] = []
-    for mapped in mapped_documents:
-        tags.extend(mapped.metadata.tags or [])
-        prepared_for.extend(mapped.metadata.preparedFor or [])
+    vat_percent = max_vat_percent if max_vat_percent > 0 else base_document.vatPercent
     deduped_tags = list(dict.fromkeys(tags))
     deduped_prepared = list(dict.fromkeys(prepared_for))
 
-    include_timesheet = any(mapped.includeTimesheet for mapped in mapped_documents)
-
-    status_priority = {
-        "rejected_performer": 0,
-        "rejected_manager": 0,
-        "draft": 10,
-        "pending_performer": 20,
-        "pending_manager": 30,
-        "manager_approved": 40,
-        "final": 50,
-    }
-    aggregated_status = base_document.approvalStatus
-    aggregated_priority = status_priority.get(aggregated_status, 10)
-    collected_notes: list[DocumentApprovalNote] = []
-
-    for mapped in mapped_documents:
-        priority = status_priority.get(mapped.approvalStatus, 10)
-        if priority < aggregated_priority:
-            aggregated_status = mapped.approvalStatus
-            aggregated_priority = priority
-        collected_notes.extend(mapped.approvalNotes or [])
-
     aggregated_metadata = base_document.metadata.copy(update={
         "tags": deduped_tags,
         "preparedFor": deduped_prepared,
@@ -3112,7 +3657,7 @@ def _merge_closing_documents(
 
     aggregated_document = base_document.copy(update={
         "type": package_label,
-        "files": list(merged_files.values()),
+        "files": merged_files,
         "taskSnapshots": unique_snapshots,
         "tasksCount": len(unique_snapshots),
         "totalHours": total_hours,
@@ -3130,6 +3675,188 @@ def _merge_closing_documents(
     return aggregated_document
 
 
+@dataclass(frozen=True)
+class _ApprovalTransition:
+    """One approval action: the checks it runs and the approval fields it rewrites."""
+
+    target_status: str
+    allowed_statuses: frozenset[str]
+    status_error: str
+    # Set when only admin, accountant or manager roles may run the action.
+    role_error: str | None = None
+    # "performer" or "manager"; without a mismatch error the assignee is required even for admins.
+    assignee: str | None = None
+    assignee_missing_error: str = ""
+    assignee_mismatch_error: str | None = None
+    note_required: bool = False
+    clear: frozenset[str] = frozenset()
+    stamp_at: tuple[str, ...] = ()
+    stamp_by: str | None = None
+
+
+_SUBMITTABLE_STATUSES = frozenset({"draft", "rejected_performer", "rejected_manager"})
+_SUBMIT_STATUS_ERROR = "Документ уже отправлен на согласование"
+_SUBMIT_ROLE_ERROR = "Недостаточно прав для отправки на согласование"
+_MANAGER_APPROVAL_FIELDS = ("manager_approved_at", "manager_approved_by")
+_PERFORMER_APPROVAL_FIELDS = ("performer_approved_at", "performer_approved_by")
+_FINALIZED_FIELDS = ("finalized_at", "finalized_by")
+
+# Keyed by (action, current status); a ``None`` status is the action's default transition.
+_APPROVAL_TRANSITIONS: Mapping[tuple[DocumentApprovalAction, str | None], _ApprovalTransition] = MappingProxyType({
+    (DocumentApprovalAction.submit, "rejected_manager"): _ApprovalTransition(
+        target_status="pending_manager",
+        allowed_statuses=_SUBMITTABLE_STATUSES,
+        status_error=_SUBMIT_STATUS_ERROR,
+        role_error=_SUBMIT_ROLE_ERROR,
+        assignee="manager",
+        assignee_missing_error="Назначьте менеджера перед отправкой на согласование",
+        clear=frozenset(_FINALIZED_FIELDS + _MANAGER_APPROVAL_FIELDS),
+        stamp_at=("submitted_at",),
+    ),
+    (DocumentApprovalAction.submit, None): _ApprovalTransition(
+        target_status="pending_performer",
+        allowed_statuses=_SUBMITTABLE_STATUSES,
+        status_error=_SUBMIT_STATUS_ERROR,
+        role_error=_SUBMIT_ROLE_ERROR,
+        assignee="performer",
+        assignee_missing_error="Назначьте исполнителя перед отправкой на согласование",
+        clear=frozenset(_FINALIZED_FIELDS + _PERFORMER_APPROVAL_FIELDS + _MANAGER_APPROVAL_FIELDS),
+        stamp_at=("submitted_at",),
+    ),
+    (DocumentApprovalAction.performer_approve, None): _ApprovalTransition(
+        target_status="pending_manager",
+        allowed_statuses=frozenset({"pending_performer"}),
+        status_error="Документ не ожидает подтверждения исполнителем",
+        assignee="performer",
+        assignee_missing_error="Документ назначен другому исполнителю",
+        assignee_mismatch_error="Документ назначен другому исполнителю",
+        stamp_at=("performer_approved_at",),
+        stamp_by="performer_approved_by",
+    ),
+    (DocumentApprovalAction.performer_reject, None): _ApprovalTransition(
+        target_status="rejected_performer",
+        allowed_statuses=frozenset({"pending_performer"}),
+        status_error="Документ не ожидает подтверждения исполнителем",
+        assignee="performer",
+        assignee_missing_error="Документ назначен другому исполнителю",
+        assignee_mismatch_error="Документ назначен другому исполнителю",
+        note_required=True,
+        clear=frozenset(_PERFORMER_APPROVAL_FIELDS + _MANAGER_APPROVAL_FIELDS),
+    ),
+    (DocumentApprovalAction.manager_approve, None): _ApprovalTransition(
+        target_status="manager_approved",
+        allowed_statuses=frozenset({"pending_manager"}),
+        status_error="Документ не ожидает согласования менеджера",
+        assignee="manager",
+        assignee_missing_error="Назначьте менеджера перед согласованием",
+        assignee_mismatch_error="Документ назначен другому менеджеру",
+        stamp_at=("manager_approved_at",),
+        stamp_by="manager_approved_by",
+    ),
+    (DocumentApprovalAction.manager_reject, None): _ApprovalTransition(
+        target_status="rejected_manager",
+        allowed_statuses=frozenset({"pending_manager"}),
+        status_error="Документ не ожидает согласования менеджера",
+        assignee="manager",
+        assignee_missing_error="Назначьте менеджера перед отклонением",
+        assignee_mismatch_error="Документ назначен другому менеджеру",
+        note_required=True,
+        clear=frozenset(_MANAGER_APPROVAL_FIELDS + _FINALIZED_FIELDS),
+    ),
+    (DocumentApprovalAction.finalize, None): _ApprovalTransition(
+        target_status="final",
+        allowed_statuses=frozenset({"manager_approved"}),
+        status_error="Документ ещё не согласован менеджером",
+        role_error="Недостаточно прав для завершения документа",
+        stamp_at=("finalized_at",),
+        stamp_by="finalized_by",
+    ),
+})
+
+
+def _append_approval_history(
+    timeline: list,
+    status: str,
+    message: str | None,
+    timestamp: str,
+    author: str,
+    role: str,
+) -> None:
+    entry = {
+        "status": status,
+        "timestamp": timestamp,
+        "author": author,
+        "role": role,
+    }
+    if message and message.strip():
+        entry["message"] = message.strip()
+    timeline.append(entry)
+
+
+def _flush_document_changes(session: Session) -> None:
+    # Document rows carry an optimistic lock (``row_version``); turn a lost race into
+    # the same ValueError every document endpoint already reports as a 400.
+    try:
+        session.flush()
+    except StaleDataError as exc:
+        raise ValueError("Документ изменён параллельно, повторите") from exc
+
+
+def _store_derived_document_fields(
+    session: Session,
+    record: Any,
+    columns: dict[str, object],
+    relations: dict[str, object] | None = None,
+) -> None:
+    """Persist defaults a read derived for ``record`` (e.g. assignees) outside the optimistic lock.
+
+    Reads must neither bump ``row_version`` under an in-flight approval nor fail
+    because of one, so the row is updated directly and only while its version is
+    still the one loaded; otherwise the write is skipped and the next read retries.
+    Rows that are new or already carry pending edits to these columns take the
+    values through the regular unit of work instead.
+    """
+    relations = relations or {}
+    state = inspect(record)
+    if not state.persistent or any(state.attrs[key].history.has_changes() for key in columns):
+        for key, value in {**columns, **relations}.items():
+            setattr(record, key, value)
+        return
+
+    model = type(record)
+    columns = {**columns, "updated_at": datetime.utcnow()}
+    session.execute(
+        update(model)
+        .where(model.id == record.id, model.row_version == record.row_version)
+        .values(**columns)
+        .execution_options(synchronize_session=False)
+    )
+    for key, value in {**columns, **relations}.items():
+        set_committed_value(record, key, value)
+
+
+def _append_approval_note(
+    notes: list,
+    status: str,
+    message: str | None,
+    timestamp: datetime,
+    author: str,
+    role: str,
+) -> None:
+    # Notes are stored as the JSON dicts they round-trip as; DocumentApprovalNote
+    # models are only built when mapping the record for a response.
+    if message and message.strip():
+        notes.append(
+            {
+                "timestamp": timestamp.isoformat(),
+                "author": author,
+                "role": role,
+                "status": status,
+                "message": message.strip(),
+            }
+        )
+
+
 def _transition_document_v2_approval(
     session: Session,
     document: orm_models.DocumentV2ORM,
@@ -3157,7 +3884,7 @@ def _transition_document_v2_approval(
         else None
     )
     effective_roles = _collect_user_roles(user_role, extra_roles_iter)
-    is_admin = bool(effective_roles & {"admin", "accountant"})
+    is_admin = bool(effective_roles & _ADMIN_ROLES)
 
     timeline = approval.get("timeline")
     if not isinstance(timeline, list):
@@ -3179,115 +3906,52 @@ def _transition_document_v2_approval(
         if isinstance(raw_id, str):
             manager_assignee_id = raw_id
 
-    def append_history(status: str, message: str | None) -> None:
-        entry = {
-            "status": status,
-            "timestamp": now.isoformat(timespec="seconds") + "Z",
-            "author": user_identifier,
-            "role": user_role,
-        }
-        if message and message.strip():
-            entry["message"] = message.strip()
-        timeline.append(entry)
-
-    if action is DocumentApprovalAction.submit:
-        allowed_statuses = {"draft", "rejected_performer", "rejected_manager"}
-        if current_status not in allowed_statuses and not is_admin:
-            raise ValueError("Документ уже отправлен на согласование")
-        if not (effective_roles & {"admin", "accountant", "manager"}):
-            raise ValueError("Недостаточно прав для отправки на согласование")
-
-        target_status = "pending_performer"
-        if current_status == "rejected_manager":
-            target_status = "pending_manager"
-
-        approval["submitted_at"] = now.isoformat()
-        approval.pop("finalized_at", None)
-        approval.pop("finalized_by", None)
-
-        if target_status == "pending_manager":
-            if manager_assignee_id is None:
-                raise ValueError("Назначьте менеджера перед отправкой на согласование")
-            approval["status"] = "pending_manager"
-            approval.pop("manager_approved_at", None)
-            approval.pop("manager_approved_by", None)
-            append_history("pending_manager", note)
-        else:
-            if not performer_assignee_id:
-                raise ValueError("Назначьте исполнителя перед отправкой на согласование")
-            approval["status"] = "pending_performer"
-            approval.pop("performer_approved_at", None)
-            approval.pop("performer_approved_by", None)
-            approval.pop("manager_approved_at", None)
-            approval.pop("manager_approved_by", None)
-            append_history("pending_performer", note)
-    elif action is DocumentApprovalAction.performer_approve:
-        if current_status != "pending_performer" and not is_admin:
-            raise ValueError("Документ не ожидает подтверждения исполнителем")
-        if not is_admin and (not performer_assignee_id or performer_assignee_id != user_id):
-            raise ValueError("Документ назначен другому исполнителю")
-        approval["status"] = "pending_manager"
-        approval["performer_approved_at"] = now.isoformat()
-        approval["performer_approved_by"] = user_identifier
-        append_history("pending_manager", note)
-    elif action is DocumentApprovalAction.performer_reject:
-        if current_status != "pending_performer" and not is_admin:
-            raise ValueError("Документ не ожидает подтверждения исполнителем")
-        if not is_admin and (not performer_assignee_id or performer_assignee_id != user_id):
-            raise ValueError("Документ назначен другому исполнителю")
-        if not note or not note.strip():
-            raise ValueError("Укажите комментарий при отклонении")
-        approval["status"] = "rejected_performer"
-        approval.pop("performer_approved_at", None)
-        approval.pop("performer_approved_by", None)
-        approval.pop("manager_approved_at", None)
-        approval.pop("manager_approved_by", None)
-        append_history("rejected_performer", note)
-    elif action is DocumentApprovalAction.manager_approve:
-        if current_status != "pending_manager" and not is_admin:
-            raise ValueError("Документ не ожидает согласования менеджера")
-        if manager_assignee_id:
-            if not is_admin and manager_assignee_id != user_id:
-                raise ValueError("Документ назначен другому менеджеру")
-        elif not is_admin:
-            raise ValueError("Назначьте менеджера перед согласованием")
-        approval["status"] = "manager_approved"
-        approval["manager_approved_at"] = now.isoformat()
-        approval["manager_approved_by"] = user_identifier
-        append_history("manager_approved", note)
-    elif action is DocumentApprovalAction.manager_reject:
-        if current_status != "pending_manager" and not is_admin:
-            raise ValueError("Документ не ожидает согласования менеджера")
-        if manager_assignee_id:
-            if not is_admin and manager_assignee_id != user_id:
-                raise ValueError("Документ назначен другому менеджеру")
-        elif not is_admin:
-            raise ValueError("Назначьте менеджера перед отклонением")
-        if not note or not note.strip():
-            raise ValueError("Укажите комментарий при отклонении")
-        approval["status"] = "rejected_manager"
-        approval.pop("manager_approved_at", None)
-        approval.pop("manager_approved_by", None)
-        approval.pop("finalized_at", None)
-        approval.pop("finalized_by", None)
-        append_history("rejected_manager", note)
-    elif action is DocumentApprovalAction.finalize:
-        if current_status != "manager_approved" and not is_admin:
-            raise ValueError("Документ ещё не согласован менеджером")
-        if not (effective_roles & {"admin", "accountant", "manager"}):
-            raise ValueError("Недостаточно прав для завершения документа")
-        approval["status"] = "final"
-        approval["finalized_at"] = now.isoformat()
-        approval["finalized_by"] = user_identifier
-        append_history("final", note)
-    else:  # pragma: no cover - defensive
+    transition = _APPROVAL_TRANSITIONS.get((action, current_status)) or _APPROVAL_TRANSITIONS.get((action, None))
+    if transition is None:  # pragma: no cover - defensive
         raise ValueError("Неизвестное действие согласования")
 
+    if current_status not in transition.allowed_statuses and not is_admin:
+        raise ValueError(transition.status_error)
+    if transition.role_error and not (effective_roles & _SUBMITTER_ROLES):
+        raise ValueError(transition.role_error)
+    if transition.assignee:
+        assignee_id = performer_assignee_id if transition.assignee == "performer" else manager_assignee_id
+        if transition.assignee_mismatch_error is None:
+            if not assignee_id:
+                raise ValueError(transition.assignee_missing_error)
+        elif not is_admin:
+            if not assignee_id:
+                raise ValueError(transition.assignee_missing_error)
+            if assignee_id != user_id:
+                raise ValueError(transition.assignee_mismatch_error)
+    if transition.note_required and (not note or not note.strip()):
+        raise ValueError("Укажите комментарий при отклонении")
+
+    now_iso = now.isoformat()
+    if transition.clear:
+        # Rebuild once instead of popping the reset fields one by one.
+        approval = {key: value for key, value in approval.items() if key not in transition.clear}
+    approval["status"] = transition.target_status
+    for key in transition.stamp_at:
+        approval[key] = now_iso
+    if transition.stamp_by:
+        approval[transition.stamp_by] = user_identifier
+    _append_approval_history(
+        timeline,
+        transition.target_status,
+        note,
+        f"{now.isoformat(timespec='seconds')}Z",
+        user_identifier,
+        user_role,
+    )
+
     approval["timeline"] = timeline
     meta["approval"] = approval
-    document.meta = dict(meta)
+    # ``meta`` is either the loaded column value or a fresh dict, so flagging it is enough.
+    document.meta = meta
     flag_modified(document, "meta")
-    session.flush()
+    # Flush here rather than at commit so a concurrent edit surfaces as a ValueError.
+    _flush_document_changes(session)
     return _map_closing_document(session, document)
 
 
@@ -3301,16 +3965,20 @@ def _calculate_hourly_rate(rate_type: str, base_rate: float, hourly_rate: float,
     return round(hourly_rate if hourly_rate > 0 else base_rate, 2)
 
 
-def _build_task_snapshots(tasks: Iterable[orm_models.TaskORM], hourly_rate: float) -> list[dict]:
+def _build_task_snapshots(
+    tasks: Iterable[orm_models.TaskORM], hourly_rate: float
+) -> tuple[list[dict], list[orm_models.TaskORM]]:
+    """Return the snapshots of tasks with unbilled time and, index-aligned, the tasks they came from."""
     snapshots: list[dict] = []
+    snapshot_tasks: list[orm_models.TaskORM] = []
+    append = snapshots.append
     for task in tasks:
-        spent_seconds = float(getattr(task, "spent_seconds", 0.0) or 0.0)
-        billed_seconds = float(getattr(task, "billed_seconds", 0.0) or 0.0)
-        remaining_seconds = max(spent_seconds - billed_seconds, 0.0)
+        # Both columns are non-nullable floats; ``or 0.0`` only guards unflushed instances.
+        remaining_seconds = float(task.spent_seconds or 0.0) - float(task.billed_seconds or 0.0)
         if remaining_seconds <= 1e-6:
             continue
         hours = round(remaining_seconds / 3600, 2)
-        snapshots.append(
+        append(
             {
                 "id": task.id,
                 "key": _issue_key(task.id),
@@ -3328,7 +3996,8 @@ def _build_task_snapshots(tasks: Iterable[orm_models.TaskORM], hourly_rate: floa
                 "assigneeAccountId": task.assignee_account_id,
             }
         )
-    return snapshots
+        snapshot_tasks.append(task)
+    return snapshots, snapshot_tasks
 
 
 def _write_document_files(
@@ -3362,9 +4031,12 @@ def _write_document_files(
     if payload.includeTimesheet:
         timesheet_id = f"{record.id}-timesheet"
         timesheet_path = DOCUMENTS_DIR / f"{timesheet_id}.xlsx"
-        header = "Key\tHours\tAmount\n"
-        rows = [f"{snapshot['key']}\t{snapshot['hours']}\t{snapshot['amount']}" for snapshot in work_package.task_snapshots]
-        timesheet_path.write_text(header + "\n".join(rows), encoding="utf-8")
+        with timesheet_path.open("w", encoding="utf-8") as handle:
+            handle.write("Key\tHours\tAmount\n")
+            handle.writelines(
+                f"{snapshot['key']}\t{snapshot['hours']}\t{snapshot['amount']}\n"
+                for snapshot in work_package.task_snapshots
+            )
         files.append(
             {
                 "id": timesheet_id,
@@ -3379,8 +4051,24 @@ def _write_document_files(
     return files
 
 
+def _as_dict(value: object) -> dict:
+    return value if isinstance(value, dict) else {}
+
+
+def _load_contract_with_parties(session: Session, contract_id: str | None) -> orm_models.ContractORM | None:
+    if not contract_id:
+        return None
+    # One joined SELECT instead of separate round-trips for the contract, client and contractor.
+    return session.execute(
+        select(orm_models.ContractORM)
+        .where(orm_models.ContractORM.id == contract_id)
+        .options(joinedload(orm_models.ContractORM.client), joinedload(orm_models.ContractORM.contractor))
+    ).scalar_one_or_none()
+
+
 def generate_document(session: Session, payload: DocumentCreateRequest) -> DocumentCreateResponse:
     work_package: orm_models.WorkPackageORM | None = None
+    contract: orm_models.ContractORM | None = None
 
     if payload.workPackageId:
         work_package = session.get(orm_models.WorkPackageORM, payload.workPackageId)
@@ -3391,7 +4079,7 @@ def generate_document(session: Session, payload: DocumentCreateRequest) -> Docum
         ).scalars().all()
         task_snapshots = work_package.task_snapshots or []
         metadata = _compose_metadata(
-            existing=work_package.metadata_json if isinstance(work_package.metadata_json, dict) else {},
+            existing=_as_dict(work_package.metadata_json),
             payload=payload,
             include_timesheet=payload.includeTimesheet,
             document_type=payload.documentType,
@@ -3418,7 +4106,7 @@ def generate_document(session: Session, payload: DocumentCreateRequest) -> Docum
         project_keys = {task.project_key for task in tasks}
         if len(project_keys) != 1:
             raise ValueError("Выберите задачи одного проекта")
-        contract = session.get(orm_models.ContractORM, payload.contractId)
+        contract = _load_contract_with_parties(session, payload.contractId)
         if not contract:
             raise ValueError("Не найден контракт")
         if not contract.client_id or not contract.contractor_id:
@@ -3427,11 +4115,16 @@ def generate_document(session: Session, payload: DocumentCreateRequest) -> Docum
         rate_type = payload.rateType or contract.rate_type or "hour"
         base_rate = float(payload.baseRate or contract.rate or 0.0)
         hourly_rate = _calculate_hourly_rate(rate_type, base_rate, payload.hourlyRate, payload.normHours)
-        task_snapshots = _build_task_snapshots(tasks, hourly_rate)
+        task_snapshots, snapshot_tasks = _build_task_snapshots(tasks, hourly_rate)
         if not task_snapshots:
             raise ValueError("Нет новых часов по выбранным задачам")
-        total_hours = round(sum(snapshot["hours"] for snapshot in task_snapshots), 2)
-        total_amount = round(sum(snapshot["amount"] for snapshot in task_snapshots), 2)
+        hours_sum = 0.0
+        amount_sum = 0.0
+        for snapshot in task_snapshots:
+            hours_sum += snapshot["hours"]
+            amount_sum += snapshot["amount"]
+        total_hours = round(hours_sum, 2)
+        total_amount = round(amount_sum, 2)
         metadata = _compose_metadata(
             existing=None,
             payload=payload,
@@ -3469,10 +4162,9 @@ def generate_document(session: Session, payload: DocumentCreateRequest) -> Docum
         session.add(work_package)
         session.flush()
 
-        increments = {snapshot["id"]: snapshot["hours"] * 3600 for snapshot in task_snapshots}
-        for task in tasks:
-            increment = increments.get(task.id)
-            if not increment or increment <= 1e-6:
+        for task, snapshot in zip(snapshot_tasks, task_snapshots):
+            increment = snapshot["hours"] * 3600
+            if increment <= 1e-6:
                 continue
             task.work_package_id = work_package.id
             task.force_included = False
@@ -3541,7 +4233,8 @@ def generate_document(session: Session, payload: DocumentCreateRequest) -> Docum
     session.add(record)
     session.flush()
 
-    contract_obj = session.get(orm_models.ContractORM, work_package.contract_id)
+    # The joined contract load already put the client and contractor into the identity map.
+    contract_obj = contract or _load_contract_with_parties(session, work_package.contract_id)
     client = session.get(orm_models.LegalEntityORM, work_package.client_id)
     contractor = session.get(orm_models.IndividualORM, work_package.contractor_id)
 
@@ -3579,6 +4272,24 @@ def generate_document(session: Session, payload: DocumentCreateRequest) -> Docum
     else:
         source_items = list(work_package.task_snapshots or [])
 
+    # --- Diagnostics about descriptions availability ---
+    total_items = len(source_items)
+    described = sum(1 for item in source_items if _has_description(item)) if source_items else 0
+
+    # Store diagnostics in metadata for visibility
+    # Collected in place and written back once, after the optional gpt tag below.
+    work_package_meta = _as_dict(work_package.metadata_json)
+    diagnostics = work_package_meta.setdefault("diagnostics", {})
+    diagnostics["tasks_total"] = total_items
+    diagnostics["tasks_with_description"] = described
+
+    # Optional guard: if caller requires real descriptions, fail before any GPT round-trip
+    require_desc = False
+    if payload.variables and isinstance(payload.variables, dict):
+        require_desc = _boolish(payload.variables.get("requireDescriptions"))
+    if require_desc and described == 0:
+        raise ValueError("В выбранных задачах нет ни одного непустого описания (description). Проверьте, что из JIRA подгружается поле 'description'.")
+
     task_bullets = _prepare_task_bullets(source_items) if source_items else []
 
     narrative_html = ""
@@ -3593,24 +4304,6 @@ def generate_document(session: Session, payload: DocumentCreateRequest) -> Docum
                 lang = gpt_options.language
             narrative_html = _build_plain_act_html(task_bullets, lang=lang)
 
-    # --- Diagnostics about descriptions availability ---
-    total_items = len(source_items)
-    described = sum(1 for item in source_items if _has_description(item)) if source_items else 0
-
-    # Store diagnostics in metadata for visibility
-    meta_diag = work_package.metadata_json if isinstance(work_package.metadata_json, dict) else {}
-    meta_diag.setdefault("diagnostics", {})
-    meta_diag["diagnostics"]["tasks_total"] = total_items
-    meta_diag["diagnostics"]["tasks_with_description"] = described
-    work_package.metadata_json = meta_diag
-
-    # Optional guard: if caller requires real descriptions, fail early
-    require_desc = False
-    if payload.variables and isinstance(payload.variables, dict):
-        require_desc = _boolish(payload.variables.get("requireDescriptions"))
-    if require_desc and described == 0:
-        raise ValueError("В выбранных задачах нет ни одного непустого описания (description). Проверьте, что из JIRA подгружается поле 'description'.")
-
     # Put narrative to context unconditionally — templates that don't use ${gptBody} will ignore it
     if narrative_html:
         context["gptBody"] = narrative_html
@@ -3630,26 +4323,22 @@ def generate_document(session: Session, payload: DocumentCreateRequest) -> Docum
         if not context.get(key):
             context[key] = value
 
-    template_export = {
-        key: context[key]
-        for key in TEMPLATE_VARIABLE_EXPORT_KEYS
-        if context.get(key)
-    }
+    template_export: dict[str, Any] = {}
+    for key in TEMPLATE_VARIABLE_EXPORT_KEYS:
+        value = context.get(key)
+        if value:
+            template_export[key] = value
     if template_export:
-        metadata_container = record.metadata_json if isinstance(record.metadata_json, dict) else {}
-        existing_snapshot = metadata_container.get("template_variables") if isinstance(metadata_container, dict) else {}
-        if not isinstance(existing_snapshot, dict):
-            existing_snapshot = {}
+        existing_snapshot = _as_dict(metadata_for_record.get("template_variables"))
         for key, value in template_export.items():
             existing_snapshot.setdefault(key, value)
-        metadata_container = dict(metadata_container or {})
-        metadata_container["template_variables"] = existing_snapshot
-        record.metadata_json = metadata_container
         metadata_for_record["template_variables"] = existing_snapshot
+        record.metadata_json = metadata_for_record
+        flag_modified(record, "metadata_json")
 
     # Decide whether to replace legacy table placeholders with the narrative
     doc_type_label = (payload.documentType or "").lower()
-    allow_table_replace = any(keyword in doc_type_label for keyword in {"служеб", "задани"})
+    allow_table_replace = any(keyword in doc_type_label for keyword in _SERVICE_ASSIGNMENT_KEYWORDS)
     replace_tables = allow_table_replace and bool(
         (getattr(payload, "gptOptions", None) and payload.gptOptions and getattr(payload.gptOptions, "enabled", False))
         or auto_wants_gpt
@@ -3661,12 +4350,19 @@ def generate_document(session: Session, payload: DocumentCreateRequest) -> Docum
         context["table2"] = narrative_html
 
         # Tag work package for traceability
-        meta = work_package.metadata_json if isinstance(work_package.metadata_json, dict) else {}
-        tags = [*(meta.get("tags") or [])]
+        tags = [*(work_package_meta.get("tags") or [])]
         if "gpt" not in tags:
             tags.append("gpt")
-        meta["tags"] = list(dict.fromkeys([t for t in tags if isinstance(t, str) and t.strip()]))
-        work_package.metadata_json = meta
+        seen_tags: set[str] = set()
+        unique_tags: list[str] = []
+        for tag in tags:
+            if isinstance(tag, str) and tag.strip() and tag not in seen_tags:
+                seen_tags.add(tag)
+                unique_tags.append(tag)
+        work_package_meta["tags"] = unique_tags
+
+    work_package.metadata_json = work_package_meta
+    flag_modified(work_package, "metadata_json")
 
     rendered_content = (
         _render_template_content(template_content, context)
@@ -3674,8 +4370,8 @@ def generate_document(session: Session, payload: DocumentCreateRequest) -> Docum
         else _build_default_document(context)
     )
 
+    # The record is already persisted; the files update goes out with the request's commit.
     record.files = _write_document_files(record, payload, work_package, rendered_content)
-    session.flush()
 
     return DocumentCreateResponse(
         record=_map_document(record),
@@ -3684,32 +4380,46 @@ def generate_document(session: Session, payload: DocumentCreateRequest) -> Docum
 
 
 def list_documents(session: Session, current_user: UserPublic | None = None) -> list[DocumentRecord]:
-    legacy_records = (
-        session.execute(
-            select(orm_models.DocumentRecordORM)
-            .options(selectinload(orm_models.DocumentRecordORM.workspace))
-            .order_by(orm_models.DocumentRecordORM.created_at.desc())
+    user_id = None
+    include_performer = include_manager = False
+    restrict_to_assignee = False
+    if current_user is not None:
+        primary_role = getattr(current_user.role, "value", current_user.role)
+        extra_roles = getattr(current_user, "roles", None)
+        extra_iterable = (
+            extra_roles
+            if isinstance(extra_roles, Iterable) and not isinstance(extra_roles, (str, bytes))
+            else None
         )
-        .scalars()
-        .all()
+        effective_roles = _collect_user_roles(primary_role, extra_iterable)
+        user_id = getattr(current_user, "id", None)
+        restrict_to_assignee = bool(user_id) and not (effective_roles & _ADMIN_ROLES)
+        if restrict_to_assignee:
+            include_performer = "performer" in effective_roles
+            include_manager = "manager" in effective_roles
+            if not (include_performer or include_manager):
+                # Such a user cannot see any document; skip loading and mapping them all.
+                return []
+
+    legacy_statement = (
+        select(orm_models.DocumentRecordORM)
+        .options(*_DOCUMENT_RECORD_LOADERS)
+        .order_by(orm_models.DocumentRecordORM.created_at.desc())
     )
-
     active_workspace_id = session.info.get("workspace_id")
     if active_workspace_id:
-        filtered_records: list[orm_models.DocumentRecordORM] = []
-        for record in legacy_records:
-            if record.workspace_id == active_workspace_id:
-                filtered_records.append(record)
-                continue
-            if (
-                getattr(record, "shared_with_parent", False)
-                and record.shared_parent_id == active_workspace_id
-            ):
-                filtered_records.append(record)
-        legacy_records = filtered_records
+        legacy_statement = legacy_statement.where(
+            or_(
+                orm_models.DocumentRecordORM.workspace_id == active_workspace_id,
+                and_(
+                    orm_models.DocumentRecordORM.shared_with_parent.is_(True),
+                    orm_models.DocumentRecordORM.shared_parent_id == active_workspace_id,
+                ),
+            )
+        )
+    legacy_records = session.execute(legacy_statement).scalars().all()
 
-    for record in legacy_records:
-        _hydrate_document_assignees(session, record)
+    _hydrate_document_assignees_bulk(session, legacy_records)
     legacy = [_map_document(record) for record in legacy_records]
 
     closing_records = (
@@ -3728,17 +4438,18 @@ def list_documents(session: Session, current_user: UserPublic | None = None) ->
         .all()
     )
 
+    # A package spans several contracts and performers, so package_id alone cannot key the groups.
     closing_group_map: dict[tuple, list[orm_models.DocumentV2ORM]] = defaultdict(list)
     for record in closing_records:
-        key = (
+        closing_group_map[(
             record.package_id or record.id,
             record.contract_id,
             record.performer_id or 0,
             record.period_start,
             record.period_end,
-        )
-        closing_group_map[key].append(record)
+        )].append(record)
 
+    _prefetch_legacy_contracts(session, closing_records)
     closing = [_merge_closing_documents(session, records) for records in closing_group_map.values()]
 
     if active_workspace_id:
@@ -3754,37 +4465,23 @@ def list_documents(session: Session, current_user: UserPublic | None = None) ->
     combined = legacy + closing
     combined.sort(key=lambda item: item.createdAt, reverse=True)
 
-    if current_user is not None:
-        primary_role = getattr(current_user.role, "value", current_user.role)
-        extra_roles = getattr(current_user, "roles", None)
-        extra_iterable = (
-            extra_roles
-            if isinstance(extra_roles, Iterable) and not isinstance(extra_roles, (str, bytes))
-            else None
-        )
-        effective_roles = _collect_user_roles(primary_role, extra_iterable)
-        user_id = getattr(current_user, "id", None)
-        is_admin = bool(effective_roles & {"admin", "accountant"})
-
-        if user_id and not is_admin:
-            include_performer = "performer" in effective_roles
-            include_manager = "manager" in effective_roles
-            if include_performer or include_manager:
-                combined = [
-                    record
-                    for record in combined
-                    if (
-                        (include_performer and record.performerAssignee is not None and record.performerAssignee.id == user_id)
-                        or (include_manager and record.managerAssignee is not None and record.managerAssignee.id == user_id)
-                    )
-                ]
-            else:
-                combined = []
+    if restrict_to_assignee:
+        # Assignees can be filled in by hydration above, so this filter stays on the mapped records.
+        combined = [
+            record
+            for record in combined
+            if (
+                (include_performer and record.performerAssignee is not None and record.performerAssignee.id == user_id)
+                or (include_manager and record.managerAssignee is not None and record.managerAssignee.id == user_id)
+            )
+        ]
 
     return combined
 
 
+@lru_cache(maxsize=4096)
 def _parse_package_v2_document_id(document_id: str) -> Optional[int]:
+    # Polling clients resend the same ids; the misses (legacy ids) are cached as well.
     if not document_id:
         return None
     if document_id.startswith("package-v2-"):
@@ -3873,11 +4570,54 @@ def list_work_packages(session: Session) -> list[WorkPackage]:
     return combined
 
 
+_DOCUMENT_CACHE_SIZE = 1024
+_document_cache: "OrderedDict[tuple, DocumentRecord]" = OrderedDict()
+_document_cache_lock = threading.Lock()
+
+
+def _row_stamp(row: Any) -> tuple | None:
+    if row is None:
+        return None
+    return row.id, row.updated_at
+
+
+def _map_document_cached(session: Session, record: orm_models.DocumentRecordORM) -> DocumentRecord:
+    """Map ``record`` through a small in-process LRU for repeated single-document reads.
+
+    The key carries the ``updated_at`` of the record and of every row the mapping
+    reads, so any flushed change produces a new key. Rows with pending changes
+    bypass the cache. Cached models are shared; callers must not mutate them.
+    """
+    rows = (
+        record,
+        record.work_package,
+        record.workspace,
+        record.performer_assignee,
+        record.manager_assignee,
+    )
+    dirty = session.dirty
+    if any(row is not None and row in dirty for row in rows):
+        return _map_document(record)
+    key = tuple(_row_stamp(row) for row in rows)
+    with _document_cache_lock:
+        cached = _document_cache.get(key)
+        if cached is not None:
+            _document_cache.move_to_end(key)
+            return cached
+
+    mapped = _map_document(record)
+    with _document_cache_lock:
+        _document_cache[key] = mapped
+        if len(_document_cache) > _DOCUMENT_CACHE_SIZE:
+            _document_cache.popitem(last=False)
+    return mapped
+
+
 def get_document(session: Session, document_id: str) -> DocumentRecord | None:
     record = session.get(orm_models.DocumentRecordORM, document_id)
     if record:
         _hydrate_document_assignees(session, record)
-        return _map_document(record)
+        return _map_document_cached(session, record)
 
     parsed_id = _parse_package_v2_document_id(document_id)
     if parsed_id is None:
@@ -3911,10 +4651,9 @@ def _remove_document_files(file_metadata: Iterable[dict]) -> None:
         fmt = (meta.get("format") or "").lower().strip()
         if not file_id or not fmt:
             continue
-        candidate = DOCUMENTS_DIR / f"{file_id}.{fmt}"
         try:
-            if candidate.exists():
-                candidate.unlink()
+            # missing_ok replaces the exists() probe: one syscall per file instead of two.
+            (DOCUMENTS_DIR / f"{file_id}.{fmt}").unlink(missing_ok=True)
         except OSError:
             # Best-effort cleanup; ignore filesystem errors.
             pass
@@ -3928,8 +4667,7 @@ def _remove_document_v2_files(paths: Iterable[str]) -> None:
             candidate = Path(raw_path)
             if not candidate.is_absolute():
                 candidate = (DOCUMENTS_DIR / candidate).resolve()
-            if candidate.exists():
-                candidate.unlink()
+            candidate.unlink(missing_ok=True)
         except OSError as exc:
             logger.warning("Unable to remove document file %s: %s", raw_path, exc)
 
@@ -3946,61 +4684,114 @@ def delete_document(session: Session, document_id: str) -> bool:
             return False
 
         package = document_v2.package
-        documents_to_remove = list(package.documents) if package else [document_v2]
+        document_v2_model = orm_models.DocumentV2ORM
+        version_model = orm_models.DocumentVersionORM
+        # File paths and task keys for every affected document in one joined SELECT,
+        # instead of walking the package, document and version collections.
+        rows = session.execute(
+            select(
+                document_v2_model.id,
+                document_v2_model.package_id,
+                document_v2_model.performer_id,
+                document_v2_model.file_path,
+                version_model.file_path,
+            )
+            .outerjoin(version_model, version_model.document_id == document_v2_model.id)
+            .where(
+                document_v2_model.package_id == package.id
+                if package
+                else document_v2_model.id == document_v2.id
+            )
+        ).all()
 
         artifact_paths: List[str] = []
         work_package_keys: set[str] = set()
+        document_ids: set[int] = set()
+
+        for doc_id, doc_package_id, performer_id, doc_path, version_path in rows:
+            if doc_id not in document_ids:
+                document_ids.add(doc_id)
+                if doc_path:
+                    artifact_paths.append(doc_path)
+                key = _v2_work_package_key_from_ids(doc_package_id, performer_id)
+                if key:
+                    work_package_keys.add(key)
+            if version_path:
+                artifact_paths.append(version_path)
 
-        for doc in documents_to_remove:
-            if doc.file_path:
-                artifact_paths.append(doc.file_path)
-            for version in doc.versions:
-                if version.file_path:
-                    artifact_paths.append(version.file_path)
-
-            key = _v2_work_package_key_from_ids(doc.package_id, doc.performer_id)
-            if key:
-                work_package_keys.add(key)
-
-        for key in work_package_keys:
-            tasks = (
-                session.execute(
-                    select(orm_models.TaskORM).where(orm_models.TaskORM.work_package_id == key)
-                )
-                .scalars()
-                .all()
+        session.flush()
+        if work_package_keys:
+            session.execute(
+                _scope_task_update(
+                    session,
+                    update(orm_models.TaskORM)
+                    .where(orm_models.TaskORM.work_package_id.in_(work_package_keys))
+                    .values(work_package_id=None, force_included=False),
+                ).execution_options(synchronize_session=False)
             )
-            for task in tasks:
-                task.work_package_id = None
-                task.force_included = False
 
+        # Children are deleted explicitly rather than through ON DELETE CASCADE:
+        # SQLite connections do not enforce foreign keys.
+        for column in (
+            orm_models.TimesheetORM.document_id,
+            version_model.document_id,
+            document_v2_model.id,
+        ):
+            session.execute(
+                delete(column.class_)
+                .where(column.in_(document_ids))
+                .execution_options(synchronize_session=False)
+            )
+        # Drop the loaded rows so the identity map does not keep serving them.
+        session.expunge(document_v2)
         if package:
-            session.delete(package)
-        else:
-            session.delete(document_v2)
-
-        session.flush()
+            session.execute(
+                delete(orm_models.ClosingPackageORM)
+                .where(orm_models.ClosingPackageORM.id == package.id)
+                .execution_options(synchronize_session=False)
+            )
+            session.expunge(package)
 
         _remove_document_v2_files(artifact_paths)
 
         return True
 
     file_metadata = list(record.files or [])
-    work_package = record.work_package
     work_package_id = record.work_package_id
+    document_model = orm_models.DocumentRecordORM
 
+    remove_work_package = False
     if work_package_id:
-        try:
-            release_work_package_tasks(session, work_package_id)
-        except ValueError:
-            # Work package might already be deleted; ignore.
-            pass
-
-    remove_work_package = bool(work_package and len(work_package.documents) <= 1)
+        session.flush()
+        session.execute(
+            _scope_task_update(
+                session,
+                update(orm_models.TaskORM)
+                .where(orm_models.TaskORM.work_package_id == work_package_id)
+                .values(work_package_id=None, force_included=False),
+            ).execution_options(synchronize_session=False)
+        )
+        # Count the package's documents instead of loading the collection to measure it.
+        remaining = session.scalar(
+            select(func.count())
+            .select_from(document_model)
+            .where(document_model.work_package_id == work_package_id)
+        )
+        remove_work_package = remaining <= 1
 
-    session.delete(record)
+    # The record has no child rows, so a plain DELETE replaces the ORM unit of work.
+    session.execute(
+        delete(document_model)
+        .where(document_model.id == record.id)
+        .execution_options(synchronize_session=False)
+    )
+    work_package = record.work_package if remove_work_package else None
+    if work_package is not None and "documents" in work_package.__dict__:
+        # Keep the package's delete cascade from revisiting the deleted row.
+        work_package.documents.remove(record)
+    session.expunge(record)
 
-    if remove_work_package and work_package is not None:
+    if work_package is not None:
         session.delete(work_package)
 
     session.flush()
@@ -4026,10 +4817,7 @@ def transition_document_approval(
         _hydrate_document_assignees(session, record)
         current_status = record.approval_status or "draft"
         now = datetime.utcnow()
-        notes = [
-            DocumentApprovalNote(**item) if not isinstance(item, DocumentApprovalNote) else item
-            for item in (record.approval_notes or [])
-        ]
+        notes = list(record.approval_notes or [])
 
         extra_roles_iter = (
             user_roles
@@ -4037,19 +4825,11 @@ def transition_document_approval(
             else None
         )
         effective_roles = _collect_user_roles(user_role, extra_roles_iter)
-        is_admin = bool(effective_roles & {"admin", "accountant"})
+        is_admin = bool(effective_roles & _ADMIN_ROLES)
+        can_submit = bool(effective_roles & _SUBMITTER_ROLES)
 
         def append_note(status: str, message: str | None) -> None:
-            if message and message.strip():
-                notes.append(
-                    DocumentApprovalNote(
-                        timestamp=now,
-                        author=user_identifier,
-                        role=user_role,
-                        status=status,
-                        message=message.strip(),
-                    )
-                )
+            _append_approval_note(notes, status, message, now, user_identifier, user_role)
 
         performer_assignee_id = record.performer_assignee_id
         manager_assignee_id = record.manager_assignee_id
@@ -4057,16 +4837,15 @@ def transition_document_approval(
         def ensure_assignee(expected_id: str | None, role_label: str) -> None:
             if not expected_id:
                 raise ValueError(f"Назначьте {role_label} перед этим действием")
-            if effective_roles & {"admin", "accountant"}:
+            if is_admin:
                 return
             if user_id != expected_id:
                 raise ValueError("Документ назначен другому пользователю")
 
         if action is DocumentApprovalAction.submit:
-            allowed_statuses = {"draft", "rejected_performer", "rejected_manager"}
-            if current_status not in allowed_statuses and not is_admin:
+            if current_status not in _SUBMITTABLE_STATUSES and not is_admin:
                 raise ValueError("Документ уже отправлен на согласование")
-            if not (effective_roles & {"admin", "accountant", "manager"}):
+            if not can_submit:
                 raise ValueError("Недостаточно прав для отправки на согласование")
 
             target_status = "pending_performer"
@@ -4121,7 +4900,7 @@ def transition_document_approval(
                 raise ValueError("Документ не ожидает согласования менеджера")
             if manager_assignee_id:
                 ensure_assignee(manager_assignee_id, "менеджера")
-            elif not (effective_roles & {"admin", "accountant"}):
+            elif not is_admin:
                 raise ValueError("Назначьте менеджера перед согласованием")
             record.approval_status = "manager_approved"
             record.manager_approved_at = now
@@ -4133,7 +4912,7 @@ def transition_document_approval(
                 raise ValueError("Документ не ожидает согласования менеджера")
             if manager_assignee_id:
                 ensure_assignee(manager_assignee_id, "менеджера")
-            elif not (effective_roles & {"admin", "accountant"}):
+            elif not is_admin:
                 raise ValueError("Назначьте менеджера перед отклонением")
             if not note or not note.strip():
                 raise ValueError("Укажите комментарий при отклонении")
@@ -4147,7 +4926,7 @@ def transition_document_approval(
         elif action is DocumentApprovalAction.finalize:
             if current_status != "manager_approved" and not is_admin:
                 raise ValueError("Документ ещё не согласован менеджером")
-            if not (effective_roles & {"admin", "accountant", "manager"}):
+            if not can_submit:
                 raise ValueError("Недостаточно прав для завершения документа")
             record.approval_status = "final"
             record.finalized_at = now
@@ -4156,8 +4935,8 @@ def transition_document_approval(
         else:  # pragma: no cover - defensive
             raise ValueError("Неизвестное действие согласования")
 
-        record.approval_notes = [note.dict() if isinstance(note, DocumentApprovalNote) else note for note in notes]
-        session.flush()
+        record.approval_notes = notes
+        _flush_document_changes(session)
         return _map_document(record)
 
     parsed_id = _parse_package_v2_document_id(document_id)
@@ -4201,7 +4980,7 @@ def share_document_with_parent(
         raise ValueError("У этого контура нет родителя")
 
     status = (record.approval_status or "draft").strip()
-    if status not in {"manager_approved", "final"}:
+    if status not in _MANAGER_APPROVED_STATUSES:
         raise ValueError("Отправить наверх можно только согласованный документ")
 
     record.shared_with_parent = True
@@ -4209,7 +4988,7 @@ def share_document_with_parent(
     record.shared_at = datetime.utcnow()
     record.shared_by_user_id = user.id
 
-    session.flush()
+    _flush_document_changes(session)
     _hydrate_document_assignees(session, record)
     return _map_document(record)
 
@@ -4228,11 +5007,34 @@ def revoke_document_share(session: Session, document_id: str) -> DocumentRecord:
     record.shared_at = None
     record.shared_by_user_id = None
 
-    session.flush()
+    _flush_document_changes(session)
     _hydrate_document_assignees(session, record)
     return _map_document(record)
 
 
+def _load_assignee_users(
+    session: Session,
+    performer_id: str | None,
+    manager_id: str | None,
+) -> tuple[orm_models.UserORM | None, orm_models.UserORM | None]:
+    requested = {user_id for user_id in (performer_id, manager_id) if user_id is not None}
+    users: dict[str, orm_models.UserORM] = {}
+    if requested:
+        # Both assignees in one round-trip.
+        users = {
+            user.id: user
+            for user in session.scalars(
+                select(orm_models.UserORM).where(orm_models.UserORM.id.in_(requested))
+            )
+        }
+        if requested - users.keys():
+            raise ValueError("Пользователь не найден")
+    return (
+        users[performer_id] if performer_id is not None else None,
+        users[manager_id] if manager_id is not None else None,
+    )
+
+
 def update_document_assignees(
     session: Session,
     document_id: str,
@@ -4257,25 +5059,16 @@ def update_document_assignees(
 
     current_status = (record.approval_status or "draft").strip()
 
-    def resolve_user(user_id: str | None) -> orm_models.UserORM | None:
-        if user_id is None:
-            return None
-        user = session.get(orm_models.UserORM, user_id)
-        if not user:
-            raise ValueError("Пользователь не найден")
-        return user
-
-    performer_user = resolve_user(performer_id)
-    manager_user = resolve_user(manager_id)
+    performer_user, manager_user = _load_assignee_users(session, performer_id, manager_id)
 
-    if performer_user is not None and current_status not in {"draft", "pending_performer", "rejected_performer"}:
+    if performer_user is not None and current_status not in _PERFORMER_EDITABLE_STATUSES:
         raise ValueError("Исполнителя можно менять только до подтверждения")
-    if performer_user is None and record.performer_assignee_id and current_status not in {"draft", "pending_performer", "rejected_performer"}:
+    if performer_user is None and record.performer_assignee_id and current_status not in _PERFORMER_EDITABLE_STATUSES:
         raise ValueError("Нельзя снять исполнителя после подтверждения")
 
-    if manager_user is not None and current_status in {"manager_approved", "final"}:
+    if manager_user is not None and current_status in _MANAGER_APPROVED_STATUSES:
         raise ValueError("Невозможно изменить менеджера после согласования")
-    if manager_user is None and record.manager_assignee_id and current_status in {"manager_approved", "final"}:
+    if manager_user is None and record.manager_assignee_id and current_status in _MANAGER_APPROVED_STATUSES:
         raise ValueError("Нельзя снять менеджера после согласования")
 
     record.performer_assignee = performer_user
@@ -4284,7 +5077,7 @@ def update_document_assignees(
     record.manager_assignee = manager_user
     record.manager_assignee_id = manager_user.id if manager_user else None
 
-    if performer_user is None and current_status in {"pending_performer", "rejected_performer"}:
+    if performer_user is None and current_status in _PERFORMER_PENDING_STATUSES:
         record.approval_status = "draft"
         record.submitted_at = None
 
@@ -4293,7 +5086,7 @@ def update_document_assignees(
         record.manager_approved_at = None
         record.manager_approved_by = None
 
-    session.flush()
+    _flush_document_changes(session)
     return _map_document(record)
 
 
@@ -4304,16 +5097,7 @@ def _update_document_v2_assignees(
     performer_id: str | None,
     manager_id: str | None,
 ) -> DocumentRecord:
-    def resolve_user(user_id: str | None) -> orm_models.UserORM | None:
-        if user_id is None:
-            return None
-        user = session.get(orm_models.UserORM, user_id)
-        if not user:
-            raise ValueError("Пользователь не найден")
-        return user
-
-    performer_user = resolve_user(performer_id)
-    manager_user = resolve_user(manager_id)
+    performer_user, manager_user = _load_assignee_users(session, performer_id, manager_id)
 
     meta = document.meta if isinstance(document.meta, dict) else {}
     if not isinstance(meta, dict):
@@ -4324,14 +5108,14 @@ def _update_document_v2_assignees(
 
     current_status = _normalize_v2_status(approval.get("status"))
 
-    if performer_user is not None and current_status not in {"draft", "pending_performer", "rejected_performer"}:
+    if performer_user is not None and current_status not in _PERFORMER_EDITABLE_STATUSES:
         raise ValueError("Исполнителя можно менять только до подтверждения")
-    if performer_user is None and approval.get("performer_assignee") and current_status not in {"draft", "pending_performer", "rejected_performer"}:
+    if performer_user is None and approval.get("performer_assignee") and current_status not in _PERFORMER_EDITABLE_STATUSES:
         raise ValueError("Нельзя снять исполнителя после подтверждения")
 
-    if manager_user is not None and current_status in {"manager_approved", "final"}:
+    if manager_user is not None and current_status in _MANAGER_APPROVED_STATUSES:
         raise ValueError("Невозможно изменить менеджера после согласования")
-    if manager_user is None and approval.get("manager_assignee") and current_status in {"manager_approved", "final"}:
+    if manager_user is None and approval.get("manager_assignee") and current_status in _MANAGER_APPROVED_STATUSES:
         raise ValueError("Нельзя снять менеджера после согласования")
 
     def to_meta(user: orm_models.UserORM | None) -> dict | None:
@@ -4354,7 +5138,7 @@ def _update_document_v2_assignees(
     else:
         approval.pop("manager_assignee", None)
 
-    if performer_user is None and current_status in {"pending_performer", "rejected_performer"}:
+    if performer_user is None and current_status in _PERFORMER_PENDING_STATUSES:
         approval["status"] = "draft"
         approval.pop("submitted_at", None)
     if manager_user is None and current_status == "pending_manager":
@@ -4363,9 +5147,10 @@ def _update_document_v2_assignees(
         approval.pop("manager_approved_by", None)
 
     meta["approval"] = approval
-    document.meta = dict(meta)
+    document.meta = meta
     flag_modified(document, "meta")
-    session.flush()
+    # Flush inside the service so a concurrent edit surfaces as a ValueError.
+    _flush_document_changes(session)
     return _map_closing_document(session, document)
 
 
@@ -4383,21 +5168,17 @@ def add_document_note(
         if not body:
             raise ValueError("Комментарий не может быть пустым")
 
-        notes = [
-            DocumentApprovalNote(**item) if not isinstance(item, DocumentApprovalNote) else item
-            for item in (record.approval_notes or [])
-        ]
-        notes.append(
-            DocumentApprovalNote(
-                timestamp=datetime.utcnow(),
-                author=user_identifier,
-                role=user_role,
-                status=record.approval_status or "draft",
-                message=body,
-            )
+        notes = list(record.approval_notes or [])
+        _append_approval_note(
+            notes,
+            record.approval_status or "draft",
+            body,
+            datetime.utcnow(),
+            user_identifier,
+            user_role,
         )
-        record.approval_notes = [note.dict() if isinstance(note, DocumentApprovalNote) else note for note in notes]
-        session.flush()
+        record.approval_notes = notes
+        _flush_document_changes(session)
         return _map_document(record)
 
     parsed_id = _parse_package_v2_document_id(document_id)
@@ -4439,5 +5220,5 @@ def add_document_note(
     approval["timeline"] = timeline
     meta["approval"] = approval
     document_v2.meta = meta
-    session.flush()
+    _flush_document_changes(session)
     return _map_closing_document(session, document_v2)
@@ -31,7 +31,7 @@ from ..schemas import (
 from .contracts import ServiceError
 from .documents import (
     DOCUMENTS_DIR,
-    _generate_gpt_act_text,
+    _generate_gpt_act_texts_batch,
     _render_template_content,
     _create_docx_from_text,
     _format_currency,
@@ -853,6 +853,7 @@ class PackageBuilder:
         assert self.ta is not None
         will_create: List[PackagePreviewDocument] = []
         generated_docs: List[PackageGeneratedDocument] = []
+        prepared_plans: List[Tuple[GroupPlan, dict, List[dict[str, object]], List[str]]] = []
         for plan in self.group_plans.values():
             doc_base_meta = {
                 "performer_type": plan.performer_type,
@@ -865,8 +866,6 @@ class PackageBuilder:
             if self.options.gpt:
                 doc_base_meta["gpt_enabled"] = bool(self.options.gpt.enabled)
                 doc_base_meta["gpt_options"] = self.options.gpt.dict()
-            base_counterparty = self._counterparty_name(plan)
-            counterparty_type, counterparty_id = self._counterparty_identity(plan)
 
             task_items = self._build_task_items(plan)
             task_ids = [str(item.get("id")) for item in task_items if item.get("id")]
@@ -892,6 +891,15 @@ class PackageBuilder:
             if task_dates and not self.options.respect_period_range:
                 plan.period_start_override = task_dates[0]
                 plan.period_end_override = task_dates[-1]
+            prepared_plans.append((plan, doc_base_meta, task_items, task_ids))
+
+        # Summaries depend only on the plan, so generate them once per plan and
+        # in a single batched GPT pass rather than once per document.
+        plan_summaries = self._build_summary_paragraphs_batch([entry[0] for entry in prepared_plans])
+
+        for (plan, doc_base_meta, task_items, task_ids), summary_paragraphs in zip(prepared_plans, plan_summaries):
+            base_counterparty = self._counterparty_name(plan)
+            counterparty_type, counterparty_id = self._counterparty_identity(plan)
 
             for doc_type in plan.doc_types:
                 templates_map = getattr(self.options, "templates", {}) or {}
@@ -969,8 +977,7 @@ class PackageBuilder:
                 self.session.add(document)
                 self.session.flush()
 
-                summary_paragraphs = self._build_summary_paragraphs(plan)
-                document.meta["summary_preview"] = summary_paragraphs
+                document.meta["summary_preview"] = list(summary_paragraphs)
                 if selected_template_id:
                     document.meta["template_id"] = selected_template_id
                 file_path = self._render_document_file(document, plan, doc_type, summary_paragraphs)
@@ -1106,31 +1113,46 @@ class PackageBuilder:
             )
         return items
 
-    def _build_summary_paragraphs(self, plan: GroupPlan) -> List[str]:
-        items = self._build_task_items(plan)
-        if not items:
-            return ["Работы по выбранным задачам отсутствуют."]
+    def _build_summary_paragraphs_batch(self, plans: List[GroupPlan]) -> List[List[str]]:
+        items_per_plan = [self._build_task_items(plan) for plan in plans]
+        summaries: List[Optional[List[str]]] = [None] * len(plans)
 
-        period_start, period_end = self._plan_period_range(plan)
         gpt_options = getattr(self.options, "gpt", None)
         if gpt_options and getattr(gpt_options, "enabled", False):
-            payload = SimpleNamespace(
-                period=f"{period_start:%d.%m.%Y} — {period_end:%d.%m.%Y}",
-                documentType="Акт",
-                gptOptions=SimpleNamespace(
-                    enabled=True,
-                    language=getattr(gpt_options, "language", "ru"),
-                    style=getattr(gpt_options, "style", "neutral"),
-                    extraNotes=getattr(gpt_options, "extraNotes", None),
-                ),
-            )
-            html = _generate_gpt_act_text(items, payload)
-            paragraphs = self._html_to_paragraphs(html)
-            if paragraphs:
-                paragraphs[0] = paragraphs[0].replace("\n", " ").strip()
-                return paragraphs
-
-        return self._build_default_paragraphs(items)
+            gpt_indices: List[int] = []
+            gpt_docs: list[tuple[Iterable, SimpleNamespace]] = []
+            for index, (plan, items) in enumerate(zip(plans, items_per_plan)):
+                if not items:
+                    continue
+                period_start, period_end = self._plan_period_range(plan)
+                payload = SimpleNamespace(
+                    period=f"{period_start:%d.%m.%Y} — {period_end:%d.%m.%Y}",
+                    documentType="Акт",
+                    gptOptions=SimpleNamespace(
+                        enabled=True,
+                        language=getattr(gpt_options, "language", "ru"),
+                        style=getattr(gpt_options, "style", "neutral"),
+                        extraNotes=getattr(gpt_options, "extraNotes", None),
+                    ),
+                )
+                gpt_indices.append(index)
+                gpt_docs.append((items, payload))
+            if gpt_docs:
+                for index, html in zip(gpt_indices, _generate_gpt_act_texts_batch(gpt_docs)):
+                    paragraphs = self._html_to_paragraphs(html)
+                    if paragraphs:
+                        paragraphs[0] = paragraphs[0].replace("\n", " ").strip()
+                        summaries[index] = paragraphs
+
+        result: List[List[str]] = []
+        for summary, items in zip(summaries, items_per_plan):
+            if summary is not None:
+                result.append(summary)
+            elif not items:
+                result.append(["Работы по выбранным задачам отсутствуют."])
+            else:
+                result.append(self._build_default_paragraphs(items))
+        return result
 
     @staticmethod
     def _html_to_paragraphs(html_content: str | None) -> List[str]:
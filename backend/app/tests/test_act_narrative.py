@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from app.services import documents
+from app.services.contracts import ServiceError
+
+
+class _FakeCompletions:
+    def __init__(self):
+        self.calls = []
+
+    def create(self, **kwargs):
+        self.calls.append(kwargs)
+        if kwargs.get("response_format"):
+            content = json.dumps({"1": "First doc.\n\nSecond paragraph.", "2": 42})
+        else:
+            content = "Single doc."
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+@pytest.fixture()
+def completions(monkeypatch):
+    fake = _FakeCompletions()
+    monkeypatch.setattr(documents, "_openai_client", SimpleNamespace(chat=SimpleNamespace(completions=fake)))
+    documents._gpt_cache.clear()
+    yield fake
+    documents._gpt_cache.clear()
+
+
+def _payload(language: str = "ru"):
+    return SimpleNamespace(
+        period="01.01.2024 — 31.01.2024",
+        documentType="Акт",
+        gptOptions=SimpleNamespace(enabled=True, language=language, style="neutral", extraNotes=None),
+    )
+
+
+ITEMS = [{"key": "ACS-1", "summary": "Summary", "description": "Implemented export", "hours": 2}]
+
+
+def test_act_batch_shares_one_call_per_language(completions):
+    results = documents._generate_gpt_act_texts_batch(
+        [(ITEMS, _payload()), (ITEMS, _payload()), (ITEMS, _payload("en")), ([], _payload())]
+    )
+
+    assert len(completions.calls) == 2
+    batched = [call for call in completions.calls if call.get("response_format")]
+    assert len(batched) == 1
+    assert "### DOC 2" in batched[0]["messages"][1]["content"]
+    assert results[0] == (
+        '<div class="doc-template doc-template--act">\n'
+        "<p>First doc.</p>\n<p>Second paragraph.</p>\n</div>"
+    )
+    # A malformed batch entry falls back to the plain act text.
+    assert "Implemented export" in results[1]
+    assert results[2] == '<div class="doc-template doc-template--act">\n<p>Single doc.</p>\n</div>'
+    assert results[3] == ""
+
+
+def test_single_act_keeps_plain_prompt(completions):
+    html = documents._generate_gpt_act_text(ITEMS, _payload())
+
+    assert "response_format" not in completions.calls[0]
+    assert html.endswith("<p>Single doc.</p>\n</div>")
+
+
+def test_act_batch_fails_as_a_whole_when_one_document_cannot_use_gpt(completions):
+    disabled = _payload()
+    disabled.gptOptions.enabled = False
+
+    with pytest.raises(ServiceError) as excinfo:
+        documents._generate_gpt_act_texts_batch([(ITEMS, _payload()), (ITEMS, disabled)])
+
+    assert excinfo.value.code == "gpt_disabled"
+    # The check runs while prompts are prepared, so nothing reaches the API.
+    assert completions.calls == []
+
+
+def test_repeated_act_request_is_served_from_cache(completions):
+    first = documents._generate_gpt_act_text(ITEMS, _payload())
+    second = documents._generate_gpt_act_text(ITEMS, _payload())
+
+    assert first == second
+    assert len(completions.calls) == 1
+
+
+def test_clean_and_trim_strips_markup_and_stops_at_limit():
+    assert documents._clean_and_trim("  <p>a &amp;&lt;b&gt;  b</p>\n c ") == "a & b c"
+    assert documents._clean_and_trim("<b>one</b> two three", limit=7) == "one two…"
+    assert documents._clean_and_trim("one   <i></i>  ", limit=3) == "one"
@@ -1,9 +1,10 @@
 from __future__ import annotations
 
+from datetime import date
 from types import SimpleNamespace
 
 import pytest
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, select, update
 from sqlalchemy.orm import sessionmaker
 
 from app.database import Base, WorkspaceSession
@@ -15,11 +16,22 @@ from app.orm_models import (
     ContractORM,
     WorkPackageORM,
     DocumentRecordORM,
+    TaskORM,
+    ClosingPackageORM,
+    DocumentV2ORM,
+    DocumentVersionORM,
 )
+from app.schemas import DocumentApprovalAction
 from app.services.documents import (
+    _merge_closing_documents,
+    add_document_note,
+    delete_document,
+    get_document,
     list_documents,
+    release_work_package_tasks,
     revoke_document_share,
     share_document_with_parent,
+    transition_document_approval,
 )
 from app.workspace_scoping import setup_workspace_events
 
@@ -194,3 +206,207 @@ def test_share_requires_approved_status(session, document_ctx):
 
     with pytest.raises(ValueError):
         share_document_with_parent(session, draft_document.id, user=document_ctx.user)
+
+
+def test_release_work_package_tasks_only_touches_active_workspace(session, document_ctx):
+    def make_task(task_id: str, workspace_id: str) -> TaskORM:
+        return TaskORM(
+            id=task_id,
+            workspace_id=workspace_id,
+            issue_id=task_id,
+            connection_id="conn-1",
+            project_key="PRJ",
+            project_name="Project",
+            work_package_id="package:7:performer:1",
+            force_included=True,
+        )
+
+    own_task = make_task("PRJ-1", document_ctx.child.id)
+    foreign_task = make_task("PRJ-2", document_ctx.parent.id)
+    session.add_all([own_task, foreign_task])
+    session.flush()
+
+    session.info["workspace_id"] = document_ctx.child.id
+    session.info["workspace_scope"] = (document_ctx.child.id,)
+
+    released = release_work_package_tasks(session, "package-v2-7")
+
+    assert released.id == "package-v2-7"
+    assert own_task.work_package_id is None
+    assert own_task.force_included is False
+    assert foreign_task.work_package_id == "package:7:performer:1"
+    assert foreign_task.force_included is True
+
+
+def test_get_document_reuses_mapping_until_record_changes(session, document_ctx):
+    document = document_ctx.create_document(suffix="cached")
+
+    first = get_document(session, document.id)
+    assert get_document(session, document.id) is first
+
+    document.notes = "updated"
+    assert get_document(session, document.id).notes == "updated"
+    session.flush()
+
+    refreshed = get_document(session, document.id)
+    assert refreshed is not first
+    assert refreshed.notes == "updated"
+
+
+def test_document_notes_round_trip_as_json(session, document_ctx):
+    document = document_ctx.create_document(suffix="notes", status="draft")
+
+    add_document_note(session, document.id, user_role="admin", user_identifier="owner@example.com", message=" first ")
+    session.commit()
+    session.expire_all()
+
+    stored = session.get(DocumentRecordORM, document.id).approval_notes
+    assert [note["message"] for note in stored] == ["first"]
+    assert isinstance(stored[0]["timestamp"], str)
+    assert get_document(session, document.id).approvalNotes[0].author == "owner@example.com"
+
+
+def test_concurrent_approval_change_is_rejected(session, document_ctx):
+    document = document_ctx.create_document(suffix="stale", status="draft")
+    document.performer_assignee_id = document_ctx.user.id
+    session.flush()
+
+    # Another request approves the document after this session loaded it.
+    session.execute(
+        update(DocumentRecordORM)
+        .where(DocumentRecordORM.id == document.id)
+        .values(row_version=DocumentRecordORM.row_version + 1)
+        .execution_options(synchronize_session=False)
+    )
+
+    with pytest.raises(ValueError, match="параллельно"):
+        transition_document_approval(
+            session,
+            document.id,
+            DocumentApprovalAction.submit,
+            user_role="admin",
+            user_identifier="owner@example.com",
+            user_id=document_ctx.user.id,
+        )
+
+
+def test_delete_closing_document_releases_tasks_of_every_performer(session, document_ctx):
+    period = date(2024, 1, 1)
+    session.add_all(
+        [
+            ClosingPackageORM(id=1, ta_id=1, period_start=period, period_end=period, package_no="P-1"),
+            ClosingPackageORM(id=2, ta_id=1, period_start=period, period_end=period, package_no="P-2"),
+        ]
+    )
+    for doc_id, package_id, performer_id in ((1, 1, 7), (2, 1, 8), (3, 2, 7)):
+        session.add(
+            DocumentV2ORM(
+                id=doc_id,
+                package_id=package_id,
+                ta_id=1,
+                doc_type="act",
+                contract_id=1,
+                performer_id=performer_id,
+                period_start=period,
+                period_end=period,
+            )
+        )
+    session.add(DocumentVersionORM(document_id=1, version=1))
+    for index, key in enumerate(("package:1:performer:7", "package:1:performer:8", "package:2:performer:7")):
+        session.add(
+            TaskORM(
+                id=f"T-{index}",
+                workspace_id=document_ctx.child.id,
+                issue_id=f"I-{index}",
+                connection_id="conn",
+                project_key="PRJ",
+                project_name="Project",
+                work_package_id=key,
+                force_included=True,
+            )
+        )
+    session.commit()
+
+    assert delete_document(session, "package-v2-1") is True
+    session.commit()
+
+    assert session.scalars(select(DocumentV2ORM.id)).all() == [3]
+    assert session.scalars(select(DocumentVersionORM.id)).all() == []
+    assert session.scalars(select(ClosingPackageORM.id)).all() == [2]
+    tasks = {task.id: (task.work_package_id, task.force_included) for task in session.scalars(select(TaskORM))}
+    assert tasks == {
+        "T-0": (None, False),
+        "T-1": (None, False),
+        "T-2": ("package:2:performer:7", True),
+    }
+
+
+def test_merged_package_keeps_untracked_rows_with_the_same_summary(session):
+    period = date(2024, 1, 1)
+    items = [
+        {"summary": "Консультация", "hours": 2, "hourlyRate": 100},
+        {"summary": "Консультация", "hours": 3, "hourlyRate": 100},
+    ]
+    session.add(ClosingPackageORM(id=1, ta_id=1, period_start=period, period_end=period, package_no="P-1"))
+    records = [
+        DocumentV2ORM(
+            id=doc_id,
+            package_id=1,
+            ta_id=1,
+            doc_type=doc_type,
+            contract_id=1,
+            period_start=period,
+            period_end=period,
+            meta={"project_key": "PRJ", "workspace_id": "ws-1", "task_items": items},
+        )
+        for doc_id, doc_type in ((1, "act"), (2, "invoice"))
+    ]
+    session.add_all(records)
+    session.flush()
+
+    merged = _merge_closing_documents(session, records)
+
+    assert len({snapshot.id for snapshot in merged.taskSnapshots}) == 2
+    assert merged.totalHours == 5
+    assert merged.amount == 500
+
+
+def test_concurrent_note_is_rejected(session, document_ctx):
+    document = document_ctx.create_document(suffix="stale-note", status="draft")
+
+    session.execute(
+        update(DocumentRecordORM)
+        .where(DocumentRecordORM.id == document.id)
+        .values(row_version=DocumentRecordORM.row_version + 1)
+        .execution_options(synchronize_session=False)
+    )
+
+    with pytest.raises(ValueError, match="параллельно"):
+        add_document_note(session, document.id, user_role="admin", user_identifier="owner@example.com", message="hi")
+
+
+def test_reading_a_document_stores_assignees_outside_the_lock(session, document_ctx):
+    performer = UserORM(id="user-perf", email="perf@example.com", full_name="Perf", role="performer", password_hash="stub")
+    session.add(performer)
+    document = document_ctx.create_document(suffix="read", status="draft")
+    stale = document_ctx.create_document(suffix="read-stale", status="draft")
+
+    assert get_document(session, document.id).performerAssignee.id == performer.id
+    stored = session.execute(
+        select(DocumentRecordORM.performer_assignee_id, DocumentRecordORM.row_version)
+        .where(DocumentRecordORM.id == document.id)
+    ).one()
+    # The backfill must not bump the version an in-flight approval was loaded with.
+    assert tuple(stored) == (performer.id, 1)
+
+    session.execute(
+        update(DocumentRecordORM)
+        .where(DocumentRecordORM.id == stale.id)
+        .values(row_version=DocumentRecordORM.row_version + 1)
+        .execution_options(synchronize_session=False)
+    )
+    # A concurrent edit makes the read skip its write-back instead of failing.
+    assert get_document(session, stale.id).performerAssignee.id == performer.id
+    assert session.scalar(
+        select(DocumentRecordORM.performer_assignee_id).where(DocumentRecordORM.id == stale.id)
+    ) is None
@@ -0,0 +1,85 @@
+from __future__ import annotations
+
+from docx import Document
+
+from app.services.documents import (
+    DocxHtmlRenderer,
+    _clear_document,
+    _extract_rows_from_fragment,
+    _preserve_spaces,
+)
+
+
+def _render(html: str):
+    document = Document()
+    _clear_document(document)
+    DocxHtmlRenderer(document).render(html)
+    return document
+
+
+def test_extract_rows_from_fragment_reads_cells_and_attributes():
+    fragment = (
+        '<td><table>'
+        '<tr><td class="doc-center wide" ALIGN=right>a &amp; <b>b</b> tail</td><td>c</td></tr>'
+        '<tr><th>d</th></tr>'
+        '</table></td>'
+    )
+
+    rows = _extract_rows_from_fragment(fragment)
+
+    assert [[cell['tag'] for cell in row] for row in rows] == [['td', 'td'], ['th']]
+    first = rows[0][0]
+    assert first['html'] == 'a &amp; <b>b</b> tail'
+    assert first['attrs'] == {'class': 'doc-center wide', 'align': 'right'}
+    assert first['classes'] == {'doc-center', 'wide'}
+
+
+def test_extract_rows_from_fragment_keeps_deeper_tables_inside_cell():
+    fragment = '<table><tr><td>outer<table><tr><td>deep</td></tr></table></td></tr></table>'
+
+    rows = _extract_rows_from_fragment(fragment)
+
+    assert len(rows) == 1
+    assert rows[0][0]['html'] == 'outer<table><tr><td>deep</td></tr></table>'
+
+
+def test_preserve_spaces_keeps_repeated_and_edge_spaces():
+    assert _preserve_spaces('a b') == 'a b'
+    assert _preserve_spaces('a   b') == 'a \u00A0\u00A0b'
+    assert _preserve_spaces(' x ') == '\u00A0x\u00A0'
+    assert _preserve_spaces('\tx') == '\u00A0\u00A0\u00A0\u00A0x'
+
+
+def test_renderer_keeps_inline_formatting_per_run():
+    document = _render('<p><b>one</b> plain <b>two</b> <i><b>three</b></i></p>')
+
+    runs = [(run.text, bool(run.bold), bool(run.italic)) for run in document.paragraphs[0].runs if run.text]
+
+    assert runs == [
+        ('one', True, False),
+        ('\u00A0plain\u00A0', False, False),
+        ('two', True, False),
+        ('\u00A0', False, False),
+        ('three', True, True),
+    ]
+
+
+def test_renderer_splits_runs_between_bold_and_italic_siblings():
+    document = _render('<p><b>x</b><i>y</i></p>')
+
+    runs = [(run.text, bool(run.bold), bool(run.italic)) for run in document.paragraphs[0].runs if run.text]
+
+    assert runs == [('x', True, False), ('y', False, True)]
+
+
+def test_renderer_replays_captured_cell_content():
+    document = _render(
+        '<table><tr><th>Head</th><td>a &lt;b&gt; &amp; <i>c</i></td></tr>'
+        '<tr><td><table><tr><td>x</td><td>y</td></tr></table></td></tr></table>'
+    )
+
+    table = document.tables[0]
+    texts = [[cell.text for cell in row.cells] for row in table.rows]
+
+    assert texts == [['Head', 'a <b> &\u00A0c'], ['x', 'y']]
+    assert all(run.bold for run in table.rows[0].cells[0].paragraphs[0].runs if run.text)